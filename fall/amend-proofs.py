@@ -1,68 +1,32 @@
 import litellm
 import json
 from tqdm import tqdm
-from lean_interact import LeanREPLConfig, LeanServer, Command
-from lean_interact.interface import LeanError
-from lean_interact.project import TempRequireProject
+from verify_pool import verify_results
 # from dotenv import load_dotenv
 
 # load_dotenv()
 
-def verify_single_result(result, project):
+def plan_result(result):
+    """Placeholders for every code of each model's latest attempt, and the jobs that fill them."""
     if not result['verification']:
         result['verification'] = {}
 
-    server = None
-    try:
-        config = LeanREPLConfig(project=project)
-        server = LeanServer(config)
-        for model in result['output']:
-            recent = max(result['output'][model].keys())
-            for generated_code in result['output'][model][recent]:
-                if not model in result['verification'].keys():
-                    result['verification'][model] = {recent: []}
-                else: result['verification'][model][recent] = []
-
-                if "ERROR:" in generated_code or not generated_code:
-                    result['verification'][model][recent].append({"status": "generation_failed", "error": generated_code})
-                    continue
-
-                generated_code = generated_code.strip("```")
-                theorem = result['formal_statement'].strip("sorry")
-                full_code = f"import Mathlib\n\n {theorem}\n{generated_code}"
-                command = Command(cmd=full_code)
-                try:
-                    response = server.run(command)
-                    if not isinstance(response, LeanError) and response.lean_code_is_valid():
-                        if len(response.sorries) == 0:
-                            result['verification'][model][recent].append({"status": "success"})
-                        else:
-                            errors = [msg for msg in response.messages]
-                            if errors:
-                                error_messages = [e.data for e in errors]
-                                result['verification'][model][recent].append({"status": "failed", "error": "\n".join(error_messages)})
-                            else:
-                                result['verification'][model][recent].append({"status": "failed", "error": "Unknown validation error"})
-
-                    elif isinstance(response, LeanError):
-                        result['verification'][model][recent].append({"status": "failed", "error": response.message})
-                    else:
-                        errors = [msg for msg in response.messages if msg.severity == 'error']
-                        if errors:
-                            error_messages = [e.data for e in errors]
-                            result['verification'][model][recent].append({"status": "failed", "error": "\n".join(error_messages)})
-                        else:
-                            result['verification'][model][recent].append({"status": "failed", "error": "Unknown validation error"})
-
-                except (TimeoutError, ConnectionAbortedError, json.JSONDecodeError) as e:
-                    print(f"{e}")
-                    result['verification'][model].append({"status": "verification_timeout", "error": str(e)})
-                except Exception as e:
-                    result['verification'][model].append({"status": "verification_error", "error": str(e)})
-    finally:
-        if server:
-            server.kill()
-    return result
+    jobs = []
+    for model in result['output']:
+        recent = max(result['output'][model].keys())
+        codes = result['output'][model][recent]
+        if not model in result['verification'].keys():
+            result['verification'][model] = {}
+        result['verification'][model][recent] = [None] * len(codes)
+        for i, generated_code in enumerate(codes):
+            if "ERROR:" in generated_code or not generated_code:
+                result['verification'][model][recent][i] = {"status": "generation_failed", "error": generated_code}
+                continue
+
+            generated_code = generated_code.strip("```")
+            theorem = result['formal_statement'].strip("sorry")
+            jobs.append((result['verification'][model][recent], i, f"\n\n {theorem}\n{generated_code}"))
+    return jobs
 
 def amend(input, output, temperature):
 
@@ -231,46 +195,13 @@ def verify(input, output):
         results = json.load(f)
     print(f"Load {len(results)} Results")
 
-    project = None
+    # every code of every result at once on warm REPLs; sorry does not count as a proof here
     try:
-        print("Setting Up Temp Project")
-        project = TempRequireProject(lean_version="v4.7.0", require="mathlib")
+        final_results = verify_results(results, plan_result, output, allow_sorry=False)
     except Exception as e:
         print(f"Exception: {e}")
         return
     
-    final_results = []
-    try:
-        for result in tqdm(results, desc="Verifying Results"):
-            n_tries = 0
-            max_tries = 3
-            verified_result = None
-            
-            while n_tries < max_tries:
-                try:
-                    verified_result = verify_single_result(result.copy(), project)
-                    break
-                except Exception as e:
-                    n_tries += 1
-                    print(f"Error When Processing {result['id']} (Try {n_tries}/{max_tries}): {e}")
-                    if n_tries == max_tries:
-                        if 'verification' not in result: 
-                            result['verification'] = {}
-                        for model in result['output'].keys():
-                           result['verification'][model].append({"status": "verification_crashed", "error": str(e)})
-                        verified_result = result
-
-            final_results.append(verified_result)
-
-            if len(final_results) % 10 == 0:
-                 with open(output, "w", encoding="utf-8") as f:
-                    json.dump(final_results, f, indent=2, ensure_ascii=False)
-    finally:
-        if final_results:
-            with open(output, "w", encoding="utf-8") as f:
-                json.dump(final_results, f, indent=2, ensure_ascii=False)
-            print(f"\nFinal Results Save to '{output}'。")
-    
     if final_results and 'output' in final_results[0] and final_results[0]['output']:
         success_count = 0
         total_count = len(final_results)
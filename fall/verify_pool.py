@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+from tqdm import tqdm
+from concurrent.futures import as_completed
+from lean_interact.interface import LeanError
+
+# the warm, memory-capped Lean pool of the winter pipeline
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "winter"))
+from lean_pool import LeanPool
+
+LEAN_VERSION = "v4.7.0"
+HEADER = "import Mathlib"
+# per-proof budget in seconds, and the one retry a timed out proof gets before it counts as a timeout
+TIMEOUT = 60
+RETRY_TIMEOUT = 180
+
+def status(future, allow_sorry=True):
+    """The verification record for one finished check, in the fall result format."""
+    e = future.exception()
+    if isinstance(e, (TimeoutError, ConnectionAbortedError, json.JSONDecodeError)):
+        return {"status": "verification_timeout", "error": str(e)}
+    if e is not None:
+        return {"status": "verification_error", "error": str(e)}
+    response = future.result()
+    if isinstance(response, LeanError):
+        return {"status": "failed", "error": response.message}
+    if response.lean_code_is_valid() and (allow_sorry or len(response.sorries) == 0):
+        return {"status": "success"}
+    # a proof that only fails by using sorry has no error messages, so report everything
+    messages = [m for m in response.messages if m.severity == 'error'] or (response.messages if response.sorries else [])
+    if messages:
+        return {"status": "failed", "error": "\n".join(m.data for m in messages)}
+    return {"status": "failed", "error": "Unknown validation error"}
+
+def progress_path(output):
+    return output + ".progress.jsonl"
+
+def load_progress(output):
+    """Verification of every result finished by an earlier, interrupted run, keyed by id."""
+    done = {}
+    if not os.path.exists(progress_path(output)):
+        return done
+    with open(progress_path(output), encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            done[record["id"]] = record["verification"]
+    return done
+
+def verify_results(results, plan, output, allow_sorry=True, workers=None):
+    """
+    Check every generated code of every result at once on a LeanPool, which imports Mathlib once
+    per worker and sizes itself to the job's cores and memory. plan(result) sets up
+    result['verification'] with placeholders and returns (list, index, code) jobs: the verdict
+    of `code` goes to list[index]. Each result is appended to output's progress file as soon as
+    its last code is checked, and a rerun skips those results.
+    """
+    done = load_progress(output)
+    if done:
+        print(f"Resuming: {len(done)} results already verified")
+    owners = {}
+    remaining = [0] * len(results)
+    with open(progress_path(output), "a", encoding="utf-8") as progress:
+        def finish(r):
+            progress.write(json.dumps({"id": results[r].get("id", r), "verification": results[r]["verification"]}, ensure_ascii=False) + "\n")
+            progress.flush()
+
+        with LeanPool(LEAN_VERSION, workers) as pool:
+            for r, result in enumerate(results):
+                if result.get("id", r) in done:
+                    result["verification"] = done[result.get("id", r)]
+                    continue
+                jobs = plan(result)
+                remaining[r] = len(jobs)
+                if not jobs:
+                    finish(r)
+                for target, index, code in jobs:
+                    owners[pool.submit(HEADER, code, TIMEOUT, RETRY_TIMEOUT)] = (r, target, index)
+            print(f"Verifying {len(owners)} codes on {pool.workers} REPLs")
+
+            for future in tqdm(as_completed(owners), total=len(owners), desc="Verifying Results"):
+                r, target, index = owners[future]
+                target[index] = status(future, allow_sorry)
+                remaining[r] -= 1
+                if remaining[r] == 0:
+                    finish(r)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    os.remove(progress_path(output))
+    print(f"\nFinal Results Save to '{output}'。")
+    return results
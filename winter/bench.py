@@ -0,0 +1,217 @@
+from mock_backends import MockChatModel, MockLeanServer
+from records import iter_theorems
+from functools import partial
+from sys import argv
+import jsonlines as jsl
+import subprocess
+import resource
+import tempfile
+import json
+import time
+import sys
+import os
+
+# offline throughput benchmark of generate_loop: a mock chat model and mock Lean REPLs stand in
+# for the provider and Mathlib, so only our own orchestration and checkpoint I/O is measured
+
+_SIZES = [500, 5000, 50000]
+# a run is a regression if its throughput falls below this fraction of the baseline's
+_TOLERANCE = 0.8
+
+_DEFAULTS = {
+    "model": "gpt",
+    "amend": False,
+    "workers": 64,
+    "lean_workers": 8,
+    "loops": 2,
+    "model_latency": 0.05,
+    "throttle_rate": 0.0,
+    "lean_latency": 0.01,
+    "pass_rate": 0.4,
+    "timeout_rate": 0.02,
+    "headers": 4,
+    "pipeline": False,
+    "async": False,
+    "stream": False,
+}
+
+def make_dataset(path, n, headers):
+    """n synthetic theorems spread over a few distinct headers, like miniCTX's shared contexts."""
+    with jsl.open(path, mode="w") as writer:
+        for i in range(n):
+            writer.write({
+                "name": f"bench_{i}",
+                "header": f"import Mathlib\nopen Nat Real\n-- context {i % headers}\n",
+                "formal_statement": f"theorem bench_{i} (n : ℕ) (h : 0 < n) : n ^ 2 ≥ n := by\n",
+            })
+
+class Stages:
+    """Wall time per pipeline stage, by wrapping the functions generate_loop calls."""
+
+    def __init__(self):
+        self.times = {}
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.times[name] = self.times.get(name, 0) + time.perf_counter() - t
+        return timed
+
+def run_one(n, config, dir):
+    import generate_concurrent
+    import generate_async
+    import pipeline
+    import journal
+    import rate_limit
+    import run
+    from lean_pool import LeanPool
+
+    # nothing may touch ../data, the network or a real model
+    journal._JOURNAL_DIR = os.path.join(dir, "journal")
+    rate_limit._BASE_BACKOFF = config["model_latency"]
+    rate_limit._MAX_BACKOFF = 20 * config["model_latency"]
+    model = lambda *args, **kwargs: MockChatModel(config["model_latency"], throttle_rate=config["throttle_rate"])
+    generate_concurrent.init_model = model
+    generate_async.init_model = model
+    generate_concurrent.CallbackHandler = lambda: None
+    generate_async.CallbackHandler = lambda: None
+    generate_concurrent.generation_started = lambda: None
+    # VerifyCache itself must stay a class: verify.cache_key calls its static key()
+    os.environ["VERIFY_CACHE"] = os.path.join(dir, "verify_cache.sqlite")
+    server = partial(MockLeanServer, config["pass_rate"], config["timeout_rate"], config["lean_latency"])
+    run.LeanPool = lambda version: LeanPool(version, config["lean_workers"], server_factory=server)
+
+    journals = []
+    class TimedJournal(journal.Journal):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.compact_time = 0
+            journals.append(self)
+
+        def compact(self, output, theorems):
+            t = time.perf_counter()
+            super().compact(output, theorems)
+            self.compact_time += time.perf_counter() - t
+    generate_concurrent.Journal = TimedJournal
+    generate_async.Journal = TimedJournal
+    pipeline.Journal = TimedJournal
+
+    stages = Stages()
+    run.generate_concurrent = stages.wrap("generate", run.generate_concurrent)
+    run.generate_async = stages.wrap("generate", run.generate_async)
+    run.verify_parallel = stages.wrap("verify", run.verify_parallel)
+    run.generate_pipelined = stages.wrap("pipeline", run.generate_pipelined)
+    run.check_accuracy_all = stages.wrap("accuracy", run.check_accuracy_all)
+
+    data = os.path.join(dir, f"bench_{n}.jsonl")
+    make_dataset(data, n, config["headers"])
+    t = time.perf_counter()
+    output = run.generate_loop(data, config["model"], config["amend"], config["workers"], config["loops"],
+                               pipeline=config["pipeline"], use_async=config["async"], stream=config["stream"])
+    total = time.perf_counter() - t
+    # generate_loop stops early when throttled; round 1 giving up leaves no output at all
+    throttled = not os.path.exists(output) or any(len(t.get("verification", [])) < config["loops"] for t in iter_theorems(output))
+    return {
+        "theorems": n,
+        "loops": config["loops"],
+        "seconds": round(total, 3),
+        "theorems_per_sec": round(n * config["loops"] / total, 2),
+        "stages": {k: round(v, 3) for k, v in stages.times.items()},
+        "journal_write": round(sum(j.write_time for j in journals), 3),
+        "journal_compact": round(sum(j.compact_time for j in journals), 3),
+        "throttled": throttled,
+        "output_mb": 0 if throttled else round(os.path.getsize(output) / 2**20, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def compare(results, baseline):
+    """Print throughput against a saved baseline; True if nothing regressed."""
+    ok = True
+    for r in results:
+        base = next((b for b in baseline if b["theorems"] == r["theorems"]), None)
+        if base is None:
+            continue
+        ratio = r["theorems_per_sec"] / base["theorems_per_sec"]
+        rss = r["peak_rss_mb"] / base["peak_rss_mb"]
+        flag = "" if ratio >= _TOLERANCE else "  REGRESSION"
+        ok = ok and ratio >= _TOLERANCE
+        print(f"{r['theorems']:>6}: {ratio:.2f}x throughput, {rss:.2f}x peak RSS vs baseline{flag}")
+    return ok
+
+def parse(args):
+    config = dict(_DEFAULTS)
+    sizes = list(_SIZES)
+    baseline = save = None
+    child = False
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--sizes":
+            sizes = [int(s) for s in args[i + 1].split(",")]
+            i += 1
+        elif arg == "--baseline":
+            baseline = args[i + 1]
+            i += 1
+        elif arg == "--save":
+            save = args[i + 1]
+            i += 1
+        elif arg == "--child":
+            child = True
+        elif arg.startswith("--") and "=" in arg:
+            key, value = arg[2:].split("=", 1)
+            key = key.replace("-", "_")
+            if key not in config:
+                print(f"Unknown option --{key}")
+                exit(1)
+            default = config[key]
+            config[key] = value == "True" if isinstance(default, bool) else type(default)(value)
+        elif arg in ("--pipeline", "--async", "--stream"):
+            config[arg[2:]] = True
+        else:
+            print(f"Unknown argument {arg}")
+            exit(1)
+        i += 1
+    return config, sizes, baseline, save, child
+
+if __name__ == "__main__":
+    if len(argv) > 1 and argv[1] == "--help":
+        print("Usage: python3 bench.py [--sizes 500,5000,50000] [--baseline <json>] [--save <json>] [--pipeline] [--async] [--stream] [--<option>=<value> ...]")
+        print("  options: " + ", ".join(f"{k}={v}" for k, v in _DEFAULTS.items()))
+        exit(0)
+    config, sizes, baseline, save, child = parse(argv[1:])
+    if child:
+        # one size per process, so peak RSS is that size's own
+        with tempfile.TemporaryDirectory() as dir:
+            result = run_one(sizes[0], config, dir)
+        print("BENCH " + json.dumps(result))
+        exit(0)
+
+    results = []
+    for n in sizes:
+        args = [sys.executable, __file__, "--child", "--sizes", str(n)] + [a for a in argv[1:] if a.startswith("--") and "=" in a]
+        args += [a for a in ("--pipeline", "--async", "--stream") if a in argv]
+        proc = subprocess.run(args, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("BENCH ")]
+        if proc.returncode != 0 or not lines:
+            print(proc.stdout[-2000:])
+            print(proc.stderr[-2000:])
+            print(f"Benchmark of {n} theorems failed")
+            exit(1)
+        result = json.loads(lines[-1][len("BENCH "):])
+        results.append(result)
+        if result["throttled"]:
+            print(f"{n:>6} theorems: generation was throttled and stopped early, so this run's throughput is not comparable")
+        stages = ", ".join(f"{k} {v}s" for k, v in result["stages"].items())
+        print(f"{n:>6} theorems x {result['loops']} rounds: {result['theorems_per_sec']} theorems/s ({stages}; "
+              f"journal {result['journal_write']}s write + {result['journal_compact']}s compact; peak RSS {result['peak_rss_mb']} MB)")
+
+    if save:
+        with open(save, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            if not compare(results, json.load(f)["results"]):
+                exit(1)
@@ -0,0 +1,137 @@
+from records import theorem_key, iter_theorems
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import os
+import re
+
+_COLUMNAR_DIR = "columnar"
+
+SCHEMA = pa.schema([
+    ("theorem", pa.string()),
+    ("model", pa.string()),
+    ("dataset", pa.string()),
+    ("mode", pa.string()),
+    ("round", pa.int16()),
+    ("verdict", pa.string()),
+    ("passed", pa.bool_()),
+    ("sample_passed", pa.bool_()),
+    ("model_time", pa.float64()),
+    ("verify_time", pa.float64()),
+    ("input_tokens", pa.int64()),
+    ("output_tokens", pa.int64()),
+    ("cached_tokens", pa.int64()),
+])
+
+def run_meta(filename, models=()):
+    """(dataset, model, mode) of a results file named <dataset>_<model>_<pass|amend>[@k].jsonl"""
+    name = os.path.basename(filename).split(".jsonl")[0]
+    for model in sorted(models, key=len, reverse=True):
+        match = re.match(rf"^(.+)_{re.escape(model)}_(pass|amend)", name)
+        if match:
+            return match.group(1), model, match.group(2)
+    match = re.match(r"^([^_]+)_(.+)_(pass|amend)", name)
+    if match:
+        return match.group(1), match.group(2), match.group(3)
+    return name, None, None
+
+def verdict_class(verification):
+    if verification is None:
+        return None
+    if "Pass" in verification:
+        return "Pass"
+    if "timed out" in verification:
+        return "Timeout"
+    if "Generation failed" in verification:
+        return "GenerationError"
+    return "Fail"
+
+def generated_rounds(theorem):
+    """
+    Rounds that actually called the model, which is what model_time and the token lists are
+    indexed by: not the copies of an already passed proof and not failed generations.
+    """
+    responses = theorem.get("responses", [])
+    verification = theorem.get("verification", [])
+    if "sample_verification" in theorem:
+        # pass@k samples: every round is its own request
+        return [r for r, response in enumerate(responses) if "ERROR: Generation failed" not in response]
+    rounds = []
+    for r, response in enumerate(responses):
+        if r > 0 and r - 1 < len(verification) and "Pass" in verification[r - 1] and response == responses[r - 1]:
+            continue
+        if "ERROR: Generation failed" in response:
+            continue
+        rounds.append(r)
+    return rounds
+
+def theorem_rows(theorem, dataset, model, mode):
+    """One row per (theorem, round)."""
+    verification = theorem.get("verification", [])
+    verify_time = theorem.get("verify_time", [])
+    samples = theorem.get("sample_verification")
+    per_call = {}
+    for n, r in enumerate(generated_rounds(theorem)):
+        per_call[r] = n
+
+    def at(field, r):
+        values = theorem.get(field, [])
+        n = per_call.get(r)
+        if n is None or n >= len(values) or values[n] == -1:
+            return None
+        return values[n]
+
+    rows = []
+    key = theorem_key(theorem)
+    for r in range(len(theorem.get("responses", []))):
+        v = verification[r] if r < len(verification) else None
+        rows.append({
+            "theorem": key,
+            "model": model,
+            "dataset": dataset,
+            "mode": mode,
+            "round": r + 1,
+            "verdict": verdict_class(v),
+            "passed": v is not None and "Pass" in v,
+            "sample_passed": "Pass" in samples[r] if samples and r < len(samples) else None,
+            "model_time": at("model_time", r),
+            "verify_time": verify_time[r] if r < len(verify_time) and verify_time[r] != -1 else None,
+            "input_tokens": at("input_tokens", r),
+            "output_tokens": at("output_tokens", r),
+            "cached_tokens": at("cached_tokens", r),
+        })
+    return rows
+
+def table_path(input):
+    dir, name = os.path.split(input)
+    return os.path.join(dir, _COLUMNAR_DIR, name.split(".jsonl")[0] + ".parquet")
+
+def export_run(input, models=()):
+    """Write a results JSONL as a Parquet table with one row per (theorem, round)."""
+    dataset, model, mode = run_meta(input, models)
+    rows = []
+    for theorem in iter_theorems(input):
+        rows.extend(theorem_rows(theorem, dataset, model, mode))
+    path = table_path(input)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), path)
+    return path
+
+def load_run(input, models=()):
+    """The table for one results file, re-exported first if the JSONL is newer."""
+    path = table_path(input)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(input) or pq.read_schema(path) != SCHEMA:
+        export_run(input, models)
+    return pq.read_table(path).to_pandas()
+
+def load_runs(dir, models=()):
+    """Every results file in dir as one DataFrame, with a `file` column naming its source."""
+    frames = []
+    for name in sorted(os.listdir(dir)):
+        if name.endswith(".jsonl"):
+            frame = load_run(os.path.join(dir, name), models)
+            frame["file"] = name
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=SCHEMA.names + ["file"])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,97 @@
+from generate_concurrent import copy_if_passed, build_input, record_response, generation_started
+from langfuse.langchain import CallbackHandler
+from init_model import init_model, provider_of
+from rate_limit import get_governor, is_throttle, MAX_RETRIES
+from journal import Journal, resume_round
+from dotenv import load_dotenv
+from tqdm import tqdm
+from records import read_theorems
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+async def process_single_theorem_async(theorem, model, model_name, governor, amend):
+    """process_single_theorem on the event loop, with the same record layout and -1 on throttle."""
+    langfuse_handler = CallbackHandler()
+
+    if copy_if_passed(theorem):
+        return theorem
+
+    prompt = build_input(theorem, amend, model_name)
+
+    for attempt in range(MAX_RETRIES + 1):
+        await governor.acquire_async()
+        try:
+            t = time.perf_counter()
+            response = await model.ainvoke(
+                prompt,
+                config={"callbacks": [langfuse_handler]}
+            )
+            t = time.perf_counter() - t
+        except asyncio.CancelledError:
+            # the round was abandoned while this request was in flight; give its slot back
+            governor.release()
+            raise
+        except Exception as e:
+            throttled = is_throttle(e)
+            governor.release(throttled=throttled)
+            if throttled and attempt < MAX_RETRIES:
+                await asyncio.sleep(governor.backoff(attempt))
+                continue
+            print(e)
+            if throttled:
+                return -1
+            theorem["responses"].append("ERROR: Generation failed")
+            return theorem
+
+        usage = record_response(theorem, response, t)
+        governor.release(tokens=usage["input_tokens"] + usage["output_tokens"] if usage else 0)
+        break
+
+    return theorem
+
+async def _generate_async(input, output, model, temp, amend, concurrency, resume):
+    generation_started()
+    load_dotenv("../.env")
+    theorems = read_theorems(input)
+    results = [None] * len(theorems)
+
+    if resume:
+        resume_round(theorems, results, output)
+    journal = Journal(output, resume)
+
+    # one client for the whole process; the provider governor bounds how many requests are in flight
+    llm = init_model(model, temp, max_connections=concurrency)
+    # models without a native ainvoke (Bedrock's Converse) run invoke on the loop's default
+    # executor, which is capped at 32 threads unless it is sized to the concurrency
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    governor = get_governor(provider_of(model), concurrency)
+
+    async def run(i):
+        return i, await process_single_theorem_async(theorems[i], llm, model, governor, amend)
+
+    tasks = [asyncio.create_task(run(i)) for i in range(len(theorems)) if results[i] is None]
+    desc = ("Amending" if amend else "Generating") + " Results"
+    for next_done in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc=desc):
+        i, result = await next_done
+        if result == -1:
+            for task in tasks:
+                task.cancel()
+            # let every cancelled request release its governor slot before the next round starts
+            await asyncio.gather(*tasks, return_exceptions=True)
+            journal.close()
+            print(f"Generation is being throttled, please wait and try again soon.\n To continue run: python run.py --repair --async {model} [amend] [dataset] [workers] [loops remaining] (finished theorems are kept in {journal.path})")
+            return -1
+        results[i] = result
+        journal.append(i, result)
+
+    journal.compact(output, results)
+    print(governor)
+    return results
+
+def generate_async(input, output, model, temp, amend, concurrency=256, resume=False):
+    """
+    Drop-in for generate_concurrent built on the chat models' ainvoke, so one process can keep
+    hundreds of API requests in flight. `concurrency` takes the place of the worker count.
+    """
+    return asyncio.run(_generate_async(input, output, model, temp, amend, concurrency, resume))
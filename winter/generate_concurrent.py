@@ -4,10 +4,14 @@ from langchain.agents import create_agent
 from langfuse.langchain import CallbackHandler
 import re
 from tqdm import tqdm
-import jsonlines as jsl
 from langfuse import observe
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from init_model import init_model
+from langchain_core.messages import HumanMessage
+from init_model import init_model, provider_of, _CACHE_POINT_MODELS
+from rate_limit import get_governor, is_throttle, MAX_RETRIES
+from journal import Journal, resume_round
+from schedule import dataset_of, load_history, expected_times, longest_first, report
+from records import iter_theorems, read_theorems, in_order, StreamWriter
 import threading
 import time
 
@@ -63,88 +67,205 @@ def cleanup(response):
 def generation_started():
     return
 
-def process_single_theorem(theorem, model_name, temp, amend):
-    langfuse_handler = CallbackHandler()
-    
-    # initialize the model
-    model = get_model(model_name, temp)
-    assert(model != None)
-
+def copy_if_passed(theorem):
+    """Start the next round of a theorem; a theorem that already passed just repeats its proof."""
     if 'responses' not in theorem.keys():
         theorem["responses"] = []    
 
     for x in theorem.get("verification", [""]):
         if "Pass" in x:
             theorem.setdefault("responses", []).append(theorem["responses"][-1])
-            return theorem
+            return True
+    return False
+
+# rough size of a token of Lean and English, to tell whether a prefix is long enough to cache
+_CHARS_PER_TOKEN = 4
 
-    prompt = PROMPT_STEM + theorem["header"]+ "\n" + theorem["formal_statement"]
+def build_prompt_parts(theorem, amend):
+    """
+    (prefix, suffix) of the prompt. The prefix is the stem plus the header, which is shared by
+    every request for the same dataset/context, so providers can cache it. The amend prompt is
+    kept as it was for comparison with earlier runs, so only its stem is shared.
+    """
+    prefix = PROMPT_STEM + theorem["header"]+ "\n"
+    suffix = theorem["formal_statement"]
     if amend:
-        prompt = AMEND_STEM + f"""
+        prefix = AMEND_STEM
+        suffix = f"""
         The incorrect proof is: {theorem["responses"][-1]}
         And the reason it is incorrect is: {theorem['verification'][-1]}
         A reminder of the theorem statement:{theorem["header"]}\n {theorem["formal_statement"]}
         """
+    return prefix, suffix
+
+def build_prompt(theorem, amend):
+    prefix, suffix = build_prompt_parts(theorem, amend)
+    return prefix + suffix
+
+def build_input(theorem, amend, model_name):
+    """What to pass to model.invoke: the prompt, with a cache point after the prefix where it can be cached."""
+    prefix, suffix = build_prompt_parts(theorem, amend)
+    if len(prefix) / _CHARS_PER_TOKEN >= _CACHE_POINT_MODELS.get(model_name, float("inf")):
+        return [HumanMessage(content=[
+            {"type": "text", "text": prefix},
+            {"cachePoint": {"type": "default"}},
+            {"type": "text", "text": suffix},
+        ])]
+    # OpenAI and Gemini cache repeated prefixes on their own, vLLM through enable_prefix_caching
+    return prefix + suffix
+
+def cached_tokens(usage):
+    """Input tokens served from the provider's prompt cache (already included in input_tokens)."""
+    return (usage.get("input_token_details") or {}).get("cache_read", 0)
+
+def record_response(theorem, response, t):
+    """Append a model response, its latency and token usage to theorem. Returns the usage."""
+    usage = getattr(response, "usage_metadata", None)
+
+    theorem["responses"].append(cleanup(response if type(response) == str else response.text))
+
+    theorem.setdefault("model_time", []).append(t)
+
+    if usage:
+        theorem.setdefault("input_tokens", [])
+        theorem.setdefault("output_tokens", [])
+        theorem.setdefault("cached_tokens", [])
+        theorem["input_tokens"].append(usage["input_tokens"])
+        theorem["output_tokens"].append(usage["output_tokens"])
+        theorem["cached_tokens"].append(cached_tokens(usage))
+    return usage
+
+def usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return usage["input_tokens"] + usage["output_tokens"] if usage else 0
+
+def invoke_governed(governor, call, tokens=usage_tokens):
+    """
+    Run call() under the provider's governor, backing off and retrying on throttles. tokens(response)
+    is what the call counts against the provider's tokens/min.
+    Returns (response, seconds); raises the last error if it fails or the retries run out.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        governor.acquire()
+        try:
+            t = time.perf_counter()
+            response = call()
+            t = time.perf_counter() - t
+        except Exception as e:
+            throttled = is_throttle(e)
+            governor.release(throttled=throttled)
+            if throttled and attempt < MAX_RETRIES:
+                time.sleep(governor.backoff(attempt))
+                continue
+            raise
+        governor.release(tokens=tokens(response))
+        return response, t
+
+def process_single_theorem(theorem, model_name, temp, amend):
+    langfuse_handler = CallbackHandler()
     
+    # initialize the model
+    model = get_model(model_name, temp)
+    assert(model != None)
+
+    if copy_if_passed(theorem):
+        return theorem
+
+    prompt = build_input(theorem, amend, model_name)
+    
+    # throttled requests back off and retry; -1 only once the retries run out
+    governor = get_governor(provider_of(model_name))
     try:
-        t = time.perf_counter()
-        response = model.invoke(
+        response, t = invoke_governed(governor, lambda: model.invoke(
             prompt,
             config={"callbacks": [langfuse_handler]}
-        )
-        t = time.perf_counter() - t
-
-        theorem["responses"].append(cleanup(response if type(response) == str else response.text))
-
-        theorem.setdefault("model_time", []).append(t)
-
-        if hasattr(response, 'usage_metadata'):
-            theorem.setdefault("input_tokens", [])
-            theorem.setdefault("output_tokens", [])
-            theorem["input_tokens"].append(response.usage_metadata["input_tokens"])
-            theorem["output_tokens"].append(response.usage_metadata["output_tokens"])
+        ))
     except Exception as e:
         print(e)
-        if e.response['Error']['Code'] == 'ThrottlingException':
+        if is_throttle(e):
             return -1
         theorem["responses"].append("ERROR: Generation failed")
-    
+        return theorem
+
+    record_response(theorem, response, t)
     return theorem
 
-def generate_concurrent(input, output, model, temp, amend, workers=4):
+def generate_streaming(input, output, model, temp, amend, workers=4, resume=False, window=None):
+    """
+    generate_concurrent for datasets too big to hold in memory: theorems are read lazily, at most
+    `window` are in flight, and results are written in input order as they complete. There is no
+    longest-first ordering, which needs every theorem up front. On resume the theorems already
+    written to the partial output are skipped.
+    """
     generation_started()
     load_dotenv("../.env")
-    theorems = list(jsl.open(input))
+    window = window or 4 * workers
+    writer = StreamWriter(output, resume, stage="generate")
+    if writer.done:
+        print(f"Resuming after {writer.done} theorems already written")
+    governor = get_governor(provider_of(model), workers)
+    desc = ("Amending" if amend else "Generating") + " Results"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        submit = lambda theorem: executor.submit(process_single_theorem, theorem, model, temp, amend)
+        for theorem, future in tqdm(in_order(iter_theorems(input, writer.done), submit, window), desc=desc):
+            result = future.result()
+            if result == -1:
+                writer.close()
+                print(f"Generation is being throttled, please wait and try again soon. {writer.done} theorems of this round are done\n To continue run: python run.py --repair --stream {model} {model} [dataset] [workers] [loops remaining] (finished theorems are kept in {writer.tmp})")
+                return -1
+            writer.write(result)
+
+    writer.commit()
+    print(governor)
+    return output
+
+def generate_concurrent(input, output, model, temp, amend, workers=4, resume=False, stream=False):
+    if stream:
+        return generate_streaming(input, output, model, temp, amend, workers, resume)
+    generation_started()
+    load_dotenv("../.env")
+    theorems = read_theorems(input)
     results = [None] * len(theorems)
+
+    # on resume, theorems the journal already has for this round are not regenerated
+    if resume:
+        resume_round(theorems, results, output)
+    journal = Journal(output, resume)
+    governor = get_governor(provider_of(model), workers)
     
     desc = f"{"Amending" if amend else "Generating"} Results"
     
+    # submit the slowest expected theorems first so they do not stretch the tail of the round
+    expected = expected_times(theorems, "model_time", load_history(dataset_of(input), "model_time", model))
+    for i, theorem in enumerate(theorems):
+        if any("Pass" in x for x in theorem.get("verification", [])):
+            expected[i] = 0
+    todo = longest_first([i for i in range(len(theorems)) if results[i] is None], expected)
+    report(expected, todo, workers, "Generation")
+
     with ThreadPoolExecutor(max_workers=workers) as executor:
         future_to_index = {
-            executor.submit(process_single_theorem, theorems[i], model, temp, amend): i for i in range(len(theorems))
+            executor.submit(process_single_theorem, theorems[i], model, temp, amend): i for i in todo
         }
 
-        pbar = tqdm(as_completed(future_to_index), total=len(theorems), desc=desc)
+        pbar = tqdm(as_completed(future_to_index), total=len(future_to_index), desc=desc)
         
-        count = 0
         for future in pbar:
             idx = future_to_index[future]
             result = future.result()
             if result == -1:
                 if "responses" in theorems[0].keys():
-                    print(f"Generation is being throttled, please wait and try again soon. Your attempt made it through {len(theorems[0]["responses"])} iterations\n To continue run: python run.py --repair {model} {model} [dataset] [workers] [loops remaining]")
+                    print(f"Generation is being throttled, please wait and try again soon. Your attempt made it through {len(theorems[0]["responses"])} iterations\n To continue run: python run.py --repair {model} {model} [dataset] [workers] [loops remaining] (finished theorems are kept in {journal.path})")
                 else:
-                    print(f"Generation is being throttled, please wait and try again soon. Your attempt made it through 0 iterations\n To continue run: python run.py --repair {model} {model} [dataset] [workers] [loops remaining]")
+                    print(f"Generation is being throttled, please wait and try again soon. Your attempt made it through 0 iterations\n To continue run: python run.py --repair {model} {model} [dataset] [workers] [loops remaining] (finished theorems are kept in {journal.path})")
                 
+                journal.close()
                 return -1
             results[idx] = result
-            
-            count += 1
-            if count % 1 == 0:
-                with jsl.open("../data/temp.jsonl", mode="w") as writer:
-                    writer.write_all([r for r in results if r is not None])
-
-    with jsl.open(output, mode="w") as writer:
-        writer.write_all(results)
+            journal.append(idx, result)
+
+    journal.compact(output, results)
+    print(governor)
     
     return results
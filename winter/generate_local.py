@@ -0,0 +1,199 @@
+from generate_concurrent import copy_if_passed, build_prompt, record_response, generation_started
+from init_model import get_shared_model
+from journal import Journal, resume_round
+from dotenv import load_dotenv
+from tqdm import tqdm
+from records import read_theorems
+import statistics
+import json
+import time
+import os
+
+def sampling_params(llm, n=1):
+    """vLLM SamplingParams matching the settings the VLLM wrapper was built with."""
+    from vllm import SamplingParams
+    return SamplingParams(n=n, temperature=llm.temperature, top_p=llm.top_p, max_tokens=llm.max_new_tokens)
+
+# V1 engine histograms that stand in for the per-request timings V0 puts on each RequestOutput
+_ENGINE_TIMINGS = {
+    "queue_wait": "vllm:request_queue_time_seconds",
+    "prefill": "vllm:request_prefill_time_seconds",
+    "decode": "vllm:request_decode_time_seconds",
+}
+
+def request_telemetry(out):
+    """
+    Token counts of one vLLM RequestOutput, and its queue wait, prefill and decode seconds and
+    decode tokens/s when the engine reports per-request metrics (V0 does, V1 leaves them None
+    and the round's timings come from engine_timings instead).
+    """
+    completion = sum(len(o.token_ids) for o in out.outputs)
+    record = {
+        "prompt_tokens": len(out.prompt_token_ids or []),
+        "completion_tokens": completion,
+        "cached_tokens": getattr(out, "num_cached_tokens", None) or 0,
+    }
+    m = getattr(out, "metrics", None)
+    if getattr(m, "first_scheduled_time", None) and getattr(m, "first_token_time", None):
+        record["queue_wait"] = round(m.first_scheduled_time - m.arrival_time, 4)
+        record["prefill"] = round(m.first_token_time - m.first_scheduled_time, 4)
+        decode = (m.last_token_time or m.first_token_time) - m.first_token_time
+        record["decode"] = round(decode, 4)
+        if decode > 0:
+            record["tokens_per_sec"] = round(completion / decode, 1)
+    return record
+
+def record_telemetry(theorem, telemetry):
+    """Token counts (as for API models) and the request's telemetry, aligned with model_time."""
+    theorem.setdefault("input_tokens", []).append(telemetry["prompt_tokens"])
+    theorem.setdefault("output_tokens", []).append(telemetry["completion_tokens"])
+    theorem.setdefault("cached_tokens", []).append(telemetry["cached_tokens"])
+    theorem.setdefault("telemetry", []).append(telemetry)
+
+def _spread(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {"mean": round(statistics.mean(values), 4), "p50": values[len(values) // 2], "p95": values[int(0.95 * (len(values) - 1))]}
+
+def engine_histograms(llm):
+    """
+    {name: (count, sum, cumulative buckets)} of the V1 engine's request timing histograms, summed
+    over label sets, to diff around a round. Empty on V0 or when the engine keeps no stats.
+    """
+    try:
+        metrics = llm.client.get_metrics()
+    except Exception:
+        return {}
+    histograms = {}
+    for m in metrics:
+        if m.name not in _ENGINE_TIMINGS.values() or not hasattr(m, "buckets"):
+            continue
+        count, total, buckets = histograms.get(m.name, (0, 0.0, {}))
+        for le, c in m.buckets.items():
+            buckets[le] = buckets.get(le, 0) + c
+        histograms[m.name] = (count + m.count, total + m.sum, buckets)
+    return histograms
+
+def engine_timings(before, after):
+    """Mean and bucketed p50/p95 of queue wait, prefill and decode over the requests between two engine_histograms."""
+    timings = {}
+    for field, name in _ENGINE_TIMINGS.items():
+        if name not in after:
+            continue
+        count, total, buckets = after[name]
+        count0, total0, buckets0 = before.get(name, (0, 0.0, {}))
+        n = count - count0
+        if n <= 0:
+            continue
+        cumulative = sorted((float(le), c - buckets0.get(le, 0)) for le, c in buckets.items())
+        # a bucket's upper bound; None past the last finite one, which JSON cannot hold as inf
+        quantile = lambda q: next((le if le != float("inf") else None for le, c in cumulative if c >= q * n), None)
+        timings[field] = {"mean": round((total - total0) / n, 4), "p50": quantile(0.5), "p95": quantile(0.95)}
+    return timings
+
+def summarize_telemetry(telemetry, seconds, engine=None):
+    """
+    One round of local generation: totals, throughput and the spread of per-request timings,
+    or on the V1 engine the engine_timings passed as `engine`.
+    """
+    completion = sum(r["completion_tokens"] for r in telemetry)
+    summary = {
+        "requests": len(telemetry),
+        "seconds": round(seconds, 2),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in telemetry),
+        "completion_tokens": completion,
+        "cached_tokens": sum(r["cached_tokens"] for r in telemetry),
+        "tokens_per_sec": round(completion / seconds, 1) if seconds > 0 else None,
+    }
+    for field in ("queue_wait", "prefill", "decode", "tokens_per_sec"):
+        spread = _spread([r[field] for r in telemetry if field in r])
+        if spread:
+            summary[field if field != "tokens_per_sec" else "request_tokens_per_sec"] = spread
+    for field, spread in (engine or {}).items():
+        summary.setdefault(field, spread)
+    return summary
+
+def telemetry_path(output):
+    return output.split(".jsonl")[0] + ".telemetry.json"
+
+def reset_telemetry(output):
+    """Start a fresh run's telemetry, so rounds of an earlier run of the same output are not mixed in."""
+    if os.path.exists(telemetry_path(output)):
+        os.remove(telemetry_path(output))
+
+def export_telemetry(output, summary):
+    """Append a round's summary to <output>.telemetry.json, one entry per round of the run."""
+    path = telemetry_path(output)
+    rounds = []
+    if os.path.exists(path):
+        with open(path) as f:
+            rounds = json.load(f)
+    rounds.append(summary)
+    with open(path, "w") as f:
+        json.dump(rounds, f, indent=2)
+    print(f"Local generation: {summary['requests']} requests, {summary['completion_tokens']} tokens at {summary['tokens_per_sec']} tok/s")
+
+def generate_batched(input, output, model, temp, amend, workers=None, resume=False, batch_size=None):
+    """
+    generate_concurrent for _LOCAL_MODELS: every pending prompt of the round (or `batch_size`
+    at a time) goes to one shared vLLM engine in a single generate call, so continuous batching
+    can fill the GPU. `workers` is only accepted for signature compatibility.
+    """
+    generation_started()
+    load_dotenv("../.env")
+    theorems = read_theorems(input)
+    results = [None] * len(theorems)
+
+    if resume:
+        resume_round(theorems, results, output)
+    journal = Journal(output, resume)
+
+    llm = get_shared_model(model, temp)
+    params = sampling_params(llm)
+
+    pending = []
+    for i, theorem in enumerate(theorems):
+        if results[i] is not None:
+            continue
+        if copy_if_passed(theorem):
+            results[i] = theorem
+            journal.append(i, theorem)
+        else:
+            pending.append(i)
+
+    window = batch_size or max(len(pending), 1)
+    telemetry = []
+    engine = engine_histograms(llm)
+    seconds = 0
+    desc = ("Amending" if amend else "Generating") + " Results"
+    pbar = tqdm(total=len(pending), desc=desc)
+    for start in range(0, len(pending), window):
+        batch = pending[start:start + window]
+        prompts = [build_prompt(theorems[i], amend) for i in batch]
+        t = time.perf_counter()
+        try:
+            outputs = llm.client.generate(prompts, params, use_tqdm=False)
+        except Exception as e:
+            print(e)
+            outputs = None
+        t = time.perf_counter() - t
+        seconds += t
+
+        for k, i in enumerate(batch):
+            if outputs is None:
+                theorems[i]["responses"].append("ERROR: Generation failed")
+            else:
+                # model_time is this request's share of the batch, so sums still give GPU time
+                record_response(theorems[i], outputs[k].outputs[0].text, t / len(batch))
+                telemetry.append(request_telemetry(outputs[k]))
+                record_telemetry(theorems[i], telemetry[-1])
+            results[i] = theorems[i]
+            journal.append(i, theorems[i])
+        pbar.update(len(batch))
+    pbar.close()
+
+    journal.compact(output, results)
+    if telemetry:
+        export_telemetry(output, summarize_telemetry(telemetry, seconds, engine_timings(engine, engine_histograms(llm))))
+    return results
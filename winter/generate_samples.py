@@ -0,0 +1,119 @@
+from generate_concurrent import get_model, build_prompt, build_input, cleanup, cached_tokens, usage_tokens, invoke_governed, generation_started
+from generate_local import sampling_params, request_telemetry, record_telemetry, summarize_telemetry, export_telemetry, engine_histograms, engine_timings
+from langchain_core.messages import HumanMessage
+from langfuse.langchain import CallbackHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from init_model import provider_of, get_shared_model, _LOCAL_MODELS
+from rate_limit import get_governor, is_throttle
+from journal import Journal, load_journal
+from dotenv import load_dotenv
+from tqdm import tqdm
+from records import read_theorems
+import time
+
+def record_samples(theorem, texts, t, usages=None, shared_prompt=False):
+    """
+    Append k samples as rounds 1..k. model_time is each sample's share of the call. When the
+    samples came from one request (shared_prompt) the prompt tokens are only counted on the first.
+    """
+    k = len(texts)
+    theorem.setdefault("responses", [])
+    for j, text in enumerate(texts):
+        theorem["responses"].append(cleanup(text))
+        theorem.setdefault("model_time", []).append(t / k)
+        usage = usages[j] if usages else None
+        if usage:
+            theorem.setdefault("input_tokens", [])
+            theorem.setdefault("output_tokens", [])
+            theorem.setdefault("cached_tokens", [])
+            if shared_prompt:
+                theorem["input_tokens"].append(usage["input_tokens"] if j == 0 else 0)
+                theorem["output_tokens"].append(usage["output_tokens"] // k)
+                theorem["cached_tokens"].append(cached_tokens(usage) if j == 0 else 0)
+            else:
+                theorem["input_tokens"].append(usage["input_tokens"])
+                theorem["output_tokens"].append(usage["output_tokens"])
+                theorem["cached_tokens"].append(cached_tokens(usage))
+
+def sample_theorem(theorem, model_name, temp, k):
+    """k samples for one theorem: a single n=k request on OpenAI, parallel fan-out elsewhere."""
+    langfuse_handler = CallbackHandler()
+    model = get_model(model_name, temp)
+    prompt = build_input(theorem, False, model_name)
+    governor = get_governor(provider_of(model_name))
+
+    def call():
+        if provider_of(model_name) == "openai":
+            result = model.generate([[HumanMessage(content=prompt)]], n=k, callbacks=[langfuse_handler])
+            messages = [g.message for g in result.generations[0]]
+            if len(messages) == k:
+                return messages, True
+        return model.batch([prompt] * k, config={"callbacks": [langfuse_handler]}), False
+
+    try:
+        (messages, shared), t = invoke_governed(governor, call, lambda result: sum(usage_tokens(m) for m in result[0]))
+    except Exception as e:
+        print(e)
+        if is_throttle(e):
+            return -1
+        theorem.setdefault("responses", []).extend(["ERROR: Generation failed"] * k)
+        return theorem
+
+    usages = [getattr(m, "usage_metadata", None) for m in messages]
+    record_samples(theorem, [m.text for m in messages], t, usages, shared)
+    return theorem
+
+def _sample_local(theorems, pending, model, temp, k, journal, output):
+    # one generate call with n=k: vLLM prefills each prompt once and shares it across samples
+    llm = get_shared_model(model, temp)
+    prompts = [build_prompt(theorems[i], False) for i in pending]
+    engine = engine_histograms(llm)
+    t = time.perf_counter()
+    outputs = llm.client.generate(prompts, sampling_params(llm, n=k))
+    t = time.perf_counter() - t
+    telemetry = []
+    for i, out in zip(pending, outputs):
+        record_samples(theorems[i], [o.text for o in out.outputs], t / len(pending))
+        # one request for all k samples: the prompt is counted on the first sample only
+        telemetry.append(request_telemetry(out))
+        for j, o in enumerate(out.outputs):
+            sample = dict(telemetry[-1], completion_tokens=len(o.token_ids))
+            if j > 0:
+                sample.update(prompt_tokens=0, cached_tokens=0)
+            record_telemetry(theorems[i], sample)
+        journal.append(i, theorems[i])
+    if telemetry:
+        export_telemetry(output, summarize_telemetry(telemetry, t, engine_timings(engine, engine_histograms(llm))))
+
+def generate_samples(input, output, model, temp, k, workers=4, resume=False):
+    """
+    Pass@k in one round: k samples per theorem recorded as rounds 1..k of `responses`,
+    for verify_parallel to check together and fold_samples to turn into pass@k verdicts.
+    """
+    generation_started()
+    load_dotenv("../.env")
+    theorems = read_theorems(input)
+
+    if resume:
+        for i, theorem in load_journal(output).items():
+            if i < len(theorems) and len(theorem.get("responses", [])) == len(theorems[i].get("responses", [])) + k:
+                theorems[i] = theorem
+    journal = Journal(output, resume)
+    pending = [i for i, t in enumerate(theorems) if len(t.get("responses", [])) < k]
+
+    if model in _LOCAL_MODELS:
+        _sample_local(theorems, pending, model, temp, k, journal, output)
+    else:
+        get_governor(provider_of(model), workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            future_to_index = {executor.submit(sample_theorem, theorems[i], model, temp, k): i for i in pending}
+            for future in tqdm(as_completed(future_to_index), total=len(future_to_index), desc=f"Sampling {k} Results"):
+                idx = future_to_index[future]
+                if future.result() == -1:
+                    journal.close()
+                    print(f"Generation is being throttled, please wait and try again soon.\n To continue run: python run.py --repair --samples {model} False [dataset] [workers] {k} (finished theorems are kept in {journal.path})")
+                    return -1
+                journal.append(idx, theorems[idx])
+
+    journal.compact(output, theorems)
+    return theorems
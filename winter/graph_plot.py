@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 from verify import *
+from summary import load_index
 import os
 import seaborn as sns
 import numpy as np
@@ -30,6 +31,21 @@ _MODEL_PRICE = {
   "qwen" : 0.6,
   "gpt_oss" : 0.6
 }
+# dollars per 1M input tokens; cached input is billed at _CACHE_READ_DISCOUNT of this
+_MODEL_INPUT_PRICE = {
+  "sonnet": 3,
+  "opus": 5,
+  "gpt": 1.25,
+  "gemini": 0.5,
+  "gemini_pro": 2,
+  "gemini_lite": 0.25,
+  "kimina": 0,
+  "deepseek": 0,
+  "goedel": 0,
+  "qwen" : 0.15,
+  "gpt_oss" : 0.15
+}
+_CACHE_READ_DISCOUNT = 0.1
 _L_MODEL_PRICE = {
     "kimina":  2,
     "goedel":  2,
@@ -40,6 +56,27 @@ _LOCAL_MODELS = {"kimina", "deepseek", "goedel"}
 def order(e):
     return e[7:]
 
+def runs(dir, dataset, t):
+    """(model name, summary) for every run in dir on `dataset` in mode `t`, from the summary index."""
+    index = load_index(dir, _MODELS)
+    return [(s["model"], s) for x, s in sorted(index.items(), key=lambda e: order(e[0])) if dataset in s["dataset"] and s["mode"] == t]
+
+def token_price(summary, name, rounds=4):
+    """Dollar cost of the first `rounds` rounds of a run, pricing cache hits at the cached rate."""
+    cached = sum(summary["cached_tokens"][:rounds])
+    uncached = sum(summary["input_tokens"][:rounds]) - cached
+    price = sum(summary["output_tokens"][:rounds]) * _MODEL_PRICE[name]
+    price += uncached * _MODEL_INPUT_PRICE[name]
+    price += cached * _MODEL_INPUT_PRICE[name] * _CACHE_READ_DISCOUNT
+    return price / 1000000
+
+def accuracy(summary, rounds=4):
+    """Accuracy % at each round 1..rounds."""
+    return [100 * p / summary["theorems"] for p in summary["passed"][:rounds]]
+
+def model_seconds(summary, rounds=4):
+    return sum(sum(times) for times in summary["model_time"][:rounds])
+
 
 def plot_time(input1, input2):
     gt = check_accuracy_all(input1)
@@ -58,16 +95,13 @@ def plot_time(input1, input2):
     plt.show() 
 
 def plot(dir):
-    datas = os.listdir(dir)
-    datas.sort(key=order)
     leng = []
     dataset = "CTX"
     t = "pass"
     for x in range(4):
         leng.append(x+1)
-    for x in datas:
-        if dataset in x and t in x:
-            plt.plot(leng, check_accuracy_all(os.path.join(dir, x))[:4], label=_MODELS[x.split(f"{dataset}_")[1].split(f"_{t}")[0]])
+    for name, summary in runs(dir, dataset, t):
+        plt.plot(leng, accuracy(summary, 4), label=_MODELS[name])
     plt.ylabel(f"Accuracy % on Mini{dataset}")
     plt.xlabel("k")
     plt.xticks(leng)
@@ -78,21 +112,14 @@ def plot(dir):
     plt.show()
 
 def plot_times(dir):
-    datas = os.listdir(dir)
-    datas.sort(key=order)
     dataset = "f2f"
     t = "amend"
     all_data=[]
     labels = []
-    for x in datas:
-        times = []
-        if dataset in x and t in x:
-            if x.split(f"{dataset}_")[1].split(f"_{t}")[0] not in _LOCAL_MODELS:
-                theorems = list(jsl.open(os.path.join(dir, x)))
-                for y in theorems:
-                    times += [i for i in y["model_time"][:4] if i != -1]
-                labels.append(_MODELS[x.split(f"{dataset}_")[1].split(f"_{t}")[0]])
-                all_data.append(times)
+    for name, summary in runs(dir, dataset, t):
+        if name not in _LOCAL_MODELS:
+            all_data.append(sum(summary["model_time"][:4], []))
+            labels.append(_MODELS[name])
 
     fig, ax = plt.subplots()
 
@@ -113,33 +140,21 @@ def ct_tokens(dir):
     
     for i, z in enumerate(ds):
         fig, ax = plt.subplots()
-        datas = os.listdir(dir)
-        datas.sort(key=order)
         dataset = ds[i][0]
         t = ds[i][1]
 
         all_data=[]
         labels = []
-        for x in datas:
-            times =0
-            if dataset in x and t in x:
-                name = x.split(f"{dataset}_")[1].split(f"_{t}")[0]
-                if name not in _LOCAL_MODELS:
-                    theorems = list(jsl.open(os.path.join(dir, x)))
-                    acc = len(theorems)
-                    for y in theorems:
-                        times += sum([i for i in y["output_tokens"][:4] if i != -1])
-                    
-                    labels.append(_MODELS[name])
-                    all_data.append(times*_MODEL_PRICE[name]/1000000/488)
-                elif name in _LOCAL_MODELS:
-                    theorems = list(jsl.open(os.path.join(dir, x)))
-                    acc = len(theorems)
-                    for y in theorems:
-                        times += sum([i for i in y["model_time"][:4] if i != -1])
-                    print(times)
-                    labels.append(_MODELS[name])
-                    all_data.append(times*_L_MODEL_PRICE[name]*0.9/3600/acc)
+        for name, summary in runs(dir, dataset, t):
+            acc = summary["theorems"]
+            if name not in _LOCAL_MODELS:
+                labels.append(_MODELS[name])
+                all_data.append(token_price(summary, name)/acc)
+            elif name in _LOCAL_MODELS:
+                times = model_seconds(summary)
+                print(times)
+                labels.append(_MODELS[name])
+                all_data.append(times*_L_MODEL_PRICE[name]*0.9/3600/acc)
         
         j=int(i/2)
         i=i%2
@@ -159,27 +174,20 @@ def ct_tokens(dir):
     
 
 def ct_times(dir):
-    datas = os.listdir(dir)
-    datas.sort(key=order)
     dataset = "f2f"
     t = "pass"
 
     all_data=[]
     labels = []
-    for x in datas:
-        times =0
-        if dataset in x and t in x:
-            name = x.split(f"{dataset}_")[1].split(f"_{t}")[0]
-            if name in _LOCAL_MODELS:
-                acc = check_accuracy_all(os.path.join(dir, x))[3]*488/100
-                if acc == 0 : continue
-                print(acc)
-                theorems = list(jsl.open(os.path.join(dir, x)))
-                for y in theorems:
-                    times += sum([i for i in y["model_time"][:4] if i != -1])
-                print(times)
-                labels.append(_MODELS[name])
-                all_data.append(times*_L_MODEL_PRICE[name]*0.9/3600/acc)
+    for name, summary in runs(dir, dataset, t):
+        if name in _LOCAL_MODELS:
+            acc = summary["passed"][3] if summary["rounds"] >= 4 else 0
+            if acc == 0 : continue
+            print(acc)
+            times = model_seconds(summary)
+            print(times)
+            labels.append(_MODELS[name])
+            all_data.append(times*_L_MODEL_PRICE[name]*0.9/3600/acc)
     fig, ax = plt.subplots()
 
     # Plot the boxplots
@@ -196,30 +204,18 @@ def ct_times(dir):
     plt.show()
 
 def scatter_tokens(dir):
-    datas = os.listdir(dir)
-    datas.sort(key=order)
     dataset = "CTX"
     t = "amend"
 
     input = []
     output = []
     color = []
-    for x in datas:
-        if dataset in x and t in x:
-            name = x.split(f"{dataset}_")[1].split(f"_{t}")[0]
-            if name not in _LOCAL_MODELS:
-                theorems = list(jsl.open(os.path.join(dir, x)))
-                for theorem in theorems:
-                    for i in range(len(theorem["output_tokens"])):
-                        if "Pass" not in theorem['verification'][i]:
-                            input.append(theorem['input_tokens'][i])
-                            output.append(theorem['output_tokens'][i])
-                            color.append('blue')
-                        else:
-                            input.append(theorem['input_tokens'][i])
-                            output.append(theorem['output_tokens'][i])
-                            color.append('red')
-                            break
+    for name, summary in runs(dir, dataset, t):
+        if name not in _LOCAL_MODELS:
+            for i, o, passed in summary["calls"]:
+                input.append(i)
+                output.append(o)
+                color.append('red' if passed else 'blue')
     plt.scatter(input, output, c=color)
     plt.xlabel('Input Tokens')
     plt.ylabel('Output Tokens')
@@ -1,6 +1,8 @@
 from langchain.chat_models import init_chat_model, BaseChatModel
 from langchain_community.llms import VLLM
 from langchain_google_genai import ChatGoogleGenerativeAI
+from botocore.config import Config
+import threading
 import torch;
 
 _MODELS = {
@@ -20,10 +22,34 @@ _MODELS = {
 _LOCAL_MODELS = {"kimina", "deepseek", "goedel"}
 _BEDROCK_MODELS = {"sonnet", "opus","qwen", "gpt_oss"}
 _LIMITED_MODELS = {"gemini_pro", "gemini"}
+# bedrock models that accept an explicit cachePoint block in the prompt, with the fewest tokens
+# a cached prefix may have (shorter prefixes are simply not cached)
+_CACHE_POINT_MODELS = {"sonnet": 1024, "opus": 4096}
 
 _MAX_TOKENS = 4096
 
-def init_model(model_name: str, temp: float) -> BaseChatModel:
+_SHARED = {}
+_shared_lock = threading.Lock()
+
+def provider_of(model_name: str) -> str:
+    """The API a model is served from, used to share rate limits between its requests."""
+    if model_name in _LOCAL_MODELS:
+        return "vllm"
+    if model_name in _BEDROCK_MODELS:
+        return "bedrock_converse"
+    if _MODELS[model_name].startswith("google_genai:"):
+        return "google_genai"
+    return "openai"
+
+def get_shared_model(model_name: str, temp: float):
+    """One model per name for the whole process, so local weights are only loaded once."""
+    with _shared_lock:
+        if model_name not in _SHARED:
+            _SHARED[model_name] = init_model(model_name, temp)
+        return _SHARED[model_name]
+
+def init_model(model_name: str, temp: float, max_connections: int = None) -> BaseChatModel:
+    # max_connections sizes boto3's HTTP pool (10 by default) for callers with many requests in flight
     assert(model_name in _MODELS)
     model_id = _MODELS[model_name]
 
@@ -36,6 +62,9 @@ def init_model(model_name: str, temp: float) -> BaseChatModel:
                 download_dir="/gpfs/scrubbed/lean-bench/models/",
                 vllm_kwargs={
                     "gpu_memory_utilization": 0.9,
+                    "enable_prefix_caching": True,
+                    # LLM.get_metrics() only has the V1 engine's timing histograms with stats on
+                    "disable_log_stats": False,
                 },
                 temperature=temp,
                 max_new_tokens=_MAX_TOKENS,
@@ -44,7 +73,8 @@ def init_model(model_name: str, temp: float) -> BaseChatModel:
         except Exception as e:
             print(e)
     elif model_name in _BEDROCK_MODELS:  # bedrock models
-        llm = init_chat_model(model_id, temperature=temp, model_provider="bedrock_converse")
+        config = Config(max_pool_connections=max_connections) if max_connections else None
+        llm = init_chat_model(model_id, temperature=temp, model_provider="bedrock_converse", config=config)
     elif model_name in _LIMITED_MODELS:
         llm = init_chat_model(model_id, temperature = temp, thinking_budget = 4000)
     else:  # not bedrock models
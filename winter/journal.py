@@ -0,0 +1,80 @@
+from records import write_theorems
+import json
+import time
+import os
+
+_JOURNAL_DIR = "../data/journal"
+# records are flushed right away but only fsynced every this many appends
+_FSYNC_EVERY = 25
+
+def journal_path(output):
+    name = os.path.basename(output).split(".jsonl")[0]
+    return os.path.join(_JOURNAL_DIR, f"{name}.journal.jsonl")
+
+def load_journal(output):
+    """Latest journaled state of each theorem for `output`, keyed by its index in the input."""
+    path = journal_path(output)
+    latest = {}
+    if not os.path.exists(path):
+        return latest
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # torn final line from a crash
+            latest[record["index"]] = record["theorem"]
+    return latest
+
+def resume_round(theorems, results, output):
+    """Fill results[i] with the journaled next round of theorems[i], where there is one."""
+    for i, theorem in load_journal(output).items():
+        if i < len(theorems) and len(theorem.get("responses", [])) == len(theorems[i].get("responses", [])) + 1:
+            results[i] = theorem
+    print(f"Resuming {sum(r is not None for r in results)} theorems from the journal")
+
+class Journal:
+    """
+    Append-only checkpoint for one output file: one line per completed (theorem, round),
+    instead of rewriting every result so far after each completion. Each output gets its own
+    journal, so runs sharing ../data do not clobber each other.
+    """
+
+    def __init__(self, output, resume=False, fsync_every=_FSYNC_EVERY):
+        os.makedirs(_JOURNAL_DIR, exist_ok=True)
+        self.path = journal_path(output)
+        self.fsync_every = fsync_every
+        self.unsynced = 0
+        self.write_time = 0
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def append(self, index, theorem):
+        t = time.perf_counter()
+        record = {"index": index, "round": len(theorem.get("responses", [])), "theorem": theorem}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.write_time += time.perf_counter() - t
+
+    def sync(self):
+        t = time.perf_counter()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.write_time += time.perf_counter() - t
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def compact(self, output, theorems):
+        """Write the finished round to `output` and drop the journal."""
+        self.close()
+        tmp = output + ".tmp"
+        write_theorems(tmp, theorems)
+        os.replace(tmp, output)
+        os.remove(self.path)
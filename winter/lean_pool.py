@@ -0,0 +1,239 @@
+from lean_interact import LeanREPLConfig, AutoLeanServer, Command
+from lean_interact.project import TempRequireProject
+from lean_interact.interface import LeanError
+from concurrent.futures import Future, as_completed
+from resources import cpu_count, memory_limit_mb, memory_used_mb
+from tqdm import tqdm
+import statistics
+import threading
+import psutil
+import queue
+import json
+
+# per-REPL resident memory assumed until a run has measured it (Mathlib REPLs take several GB)
+_REPL_MB = 6000
+# typical (p90) per-REPL memory seen by earlier runs, per Lean version
+_RSS_HISTORY = "../data/lean_rss.json"
+# memory kept back for the rest of the job (the model process, Python, page cache)
+_RESERVED_MB = 16000
+# a worker's REPL is restarted between jobs once it passes this fraction of its hard cap
+_RECYCLE_FRACTION = 0.8
+# ... or once the whole job is this close to its memory limit, before the OOM killer steps in
+_PRESSURE = 0.92
+# elaborating a header (import Mathlib + context) the first time on a worker can be slow
+_HEADER_TIMEOUT = 300
+# how much longer a worker's queue may be than the shortest one before a header is copied elsewhere
+_AFFINITY_SLACK = 2
+
+def server_rss_mb(server):
+    """Resident memory of a server's REPL process tree in MB, or 0 if it is not running."""
+    proc = getattr(server, "_proc", None)
+    if proc is None:
+        return 0
+    try:
+        root = psutil.Process(proc.pid)
+        rss = root.memory_info().rss
+        for child in root.children(recursive=True):
+            rss += child.memory_info().rss
+    except psutil.Error:
+        return 0
+    return rss / 2**20
+
+def observed_rss(lean_version):
+    try:
+        with open(_RSS_HISTORY) as f:
+            return json.load(f).get(lean_version)
+    except (OSError, ValueError):
+        return None
+
+def save_observed_rss(lean_version, mb):
+    history = {}
+    try:
+        with open(_RSS_HISTORY) as f:
+            history = json.load(f)
+    except (OSError, ValueError):
+        pass
+    history[lean_version] = round(mb)
+    try:
+        with open(_RSS_HISTORY, "w") as f:
+            json.dump(history, f)
+    except OSError as e:
+        # only a sizing hint for the next run, not worth failing this one over
+        print(f"Could not save Lean memory use: {e}")
+
+def size_workers(lean_version, workers=None):
+    """
+    (workers, MB cap per REPL) for this allocation: as many workers as there are usable cores,
+    fewer if the cgroup memory left after _RESERVED_MB cannot hold that many REPLs of the size
+    seen last time. An explicit worker count is kept and only the cap is derived.
+    """
+    per_repl = observed_rss(lean_version) or _REPL_MB
+    budget = max(per_repl, memory_limit_mb() - memory_used_mb() - _RESERVED_MB)
+    if workers is None:
+        workers = max(1, min(cpu_count(), int(budget // per_repl)))
+    cap = budget / workers
+    print(f"Lean pool: {workers} workers capped at {cap:.0f} MB each ({cpu_count()} cores, {memory_limit_mb():.0f} MB limit, ~{per_repl:.0f} MB per REPL)")
+    return workers, cap
+
+class LeanPool:
+    """
+    A fixed set of Lean REPL workers that stay warm for the whole run.py invocation, so each
+    round of generate_loop reuses the same processes instead of re-importing Mathlib.
+
+    Jobs are (header, body) pairs. Each worker elaborates a header once, keeps the resulting
+    REPL environment and runs only the body against it, and jobs are routed to a worker that
+    already holds their header unless that worker is falling behind.
+    """
+
+    def __init__(self, lean_version, workers=None, recycle_mb=None, server_factory=None):
+        self.lean_version = lean_version
+        self.workers, self.cap_mb = size_workers(lean_version, workers)
+        self.memory_limit = memory_limit_mb()
+        # server_factory() builds a worker's server; by default an AutoLeanServer on a Mathlib project
+        if server_factory is None:
+            print("Setting Up Temp Project")
+            self.project = TempRequireProject(lean_version=lean_version, require="mathlib")
+            # past the hard cap a REPL is killed on its own, not the whole job
+            self.config = LeanREPLConfig(project=self.project, memory_hard_limit_mb=int(self.cap_mb))
+            server_factory = lambda: AutoLeanServer(self.config)
+        self.server_factory = server_factory
+        self.recycle_mb = recycle_mb or _RECYCLE_FRACTION * self.cap_mb
+        self.rss_samples = []  # a worker's REPL memory after each job, for its typical size
+        self.recycles = 0
+        self.retries = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.queues = [queue.Queue() for _ in range(self.workers)]
+        self.holders = {}  # header -> indices of workers that have (or will have) it elaborated
+        self.threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(i,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _route(self, header):
+        with self.lock:
+            shortest = min(range(self.workers), key=lambda i: self.queues[i].qsize())
+            holders = self.holders.setdefault(header, set())
+            if holders:
+                best = min(holders, key=lambda i: self.queues[i].qsize())
+                if self.queues[best].qsize() <= self.queues[shortest].qsize() + _AFFINITY_SLACK:
+                    return best
+            holders.add(shortest)
+            return shortest
+
+    def _next(self, i):
+        """Next job for worker i: its own queue first, otherwise steal from the longest queue."""
+        while True:
+            try:
+                return self.queues[i].get_nowait()
+            except queue.Empty:
+                pass
+            longest = max(self.queues, key=lambda q: q.qsize())
+            try:
+                return longest.get_nowait()
+            except queue.Empty:
+                pass
+            if self.closed:
+                return None
+            try:
+                return self.queues[i].get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _snapshot(self, server, envs, header):
+        if header not in envs:
+            # kept in the session cache so the env id survives AutoLeanServer's own restarts
+            try:
+                result = server.run(Command(cmd=header), timeout=_HEADER_TIMEOUT, add_to_session_cache=True)
+            except Exception:
+                # a timeout or crash says nothing about the header: this job checks it inline and
+                # the next one with the same header tries the snapshot again
+                return None
+            if isinstance(result, LeanError) or not result.lean_code_is_valid():
+                envs[header] = None
+            else:
+                envs[header] = result.env
+        return envs[header]
+
+    def _work(self, i):
+        server = None
+        envs = {}  # header -> REPL env id on this worker
+        while True:
+            job = self._next(i)
+            if job is None:
+                break
+            header, body, timeout, retry_timeout, future = job
+            # a re-queued retry is already running
+            if not future.running() and not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if server is None:
+                    server = self.server_factory()
+                env = self._snapshot(server, envs, header)
+                if env is None:
+                    # the header does not elaborate on its own, check everything in one go
+                    command = Command(cmd=header + body)
+                else:
+                    command = Command(cmd=body, env=env)
+                future.set_result(server.run(command, timeout=timeout))
+            except TimeoutError as e:
+                if retry_timeout:
+                    # one more try with the larger budget, on whichever worker frees up first
+                    self.retries += 1
+                    self._shortest().put((header, body, retry_timeout, None, future))
+                else:
+                    future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            rss = server_rss_mb(server) if server is not None else 0
+            if rss:
+                self.rss_samples.append(rss)
+            if server is not None and (rss > self.recycle_mb or memory_used_mb() > _PRESSURE * self.memory_limit):
+                server.kill()
+                server = None
+                envs.clear()
+                self.recycles += 1
+        if server is not None:
+            server.kill()
+
+    def _shortest(self):
+        with self.lock:
+            return min(self.queues, key=lambda q: q.qsize())
+
+    def submit(self, header, body, timeout=60, retry_timeout=None):
+        """Queue a job; if it times out and retry_timeout is given, it is re-run once with that budget."""
+        future = Future()
+        self.queues[self._route(header)].put((header, body, timeout, retry_timeout, future))
+        return future
+
+    def run_batch(self, jobs, timeout_per_cmd=60, show_progress=False, timeouts=None, retry_timeouts=None):
+        """
+        Run (header, body) jobs on the warm workers; exceptions are returned in place of results.
+        timeouts/retry_timeouts optionally give each job its own budgets instead of timeout_per_cmd.
+        """
+        timeouts = timeouts or [timeout_per_cmd] * len(jobs)
+        retry_timeouts = retry_timeouts or [None] * len(jobs)
+        futures = [self.submit(header, body, t, r) for (header, body), t, r in zip(jobs, timeouts, retry_timeouts)]
+        if show_progress:
+            for _ in tqdm(as_completed(futures), total=len(futures), desc="Verifying Results"):
+                pass
+        return [f.exception() or f.result() for f in futures]
+
+    def close(self):
+        self.closed = True
+        for thread in self.threads:
+            thread.join()
+        if len(self.rss_samples) >= 2:
+            # the peak mostly tracks the recycle threshold; p90 is what a REPL settles at
+            save_observed_rss(self.lean_version, statistics.quantiles(self.rss_samples, n=10)[-1])
+        if self.recycles:
+            print(f"Recycled {self.recycles} Lean workers over {self.recycle_mb:.0f} MB or under memory pressure")
+        if self.retries:
+            print(f"Re-ran {self.retries} timed out Lean commands with a larger budget")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,57 @@
+from collections import Counter
+from records import iter_theorems
+import re
+
+# one node of trace.profiler output: "  [Elab.step] [0.123456] nlinarith [sq_nonneg (a - b)]"
+_NODE = re.compile(r"^(\s*)\[([\w.]+)\] \[([0-9]+\.[0-9]+)\] ?(.*)$")
+
+def _tactic_name(text):
+    words = text.replace("·", " ").split()
+    return words[0] if words else "?"
+
+def parse_profile(messages):
+    """
+    Structured record of the trace.profiler output in a REPL response's messages:
+    seconds per declaration, self time per tactic (children excluded), total typeclass
+    inference time.
+    """
+    decls = Counter()
+    tactics = Counter()
+    typeclass = 0.0
+    for message in messages:
+        stack = []  # (indent, cls, tactic, time, child time)
+        def pop():
+            indent, cls, tactic, t, children = stack.pop()
+            if cls == "Elab.step":
+                tactics[tactic] += max(0.0, t - children)
+            if stack:
+                stack[-1][4] += t
+        for line in message.data.splitlines():
+            node = _NODE.match(line)
+            if not node:
+                continue
+            indent, cls, t, text = len(node.group(1)), node.group(2), float(node.group(3)), node.group(4)
+            while stack and stack[-1][0] >= indent:
+                pop()
+            if cls == "Elab.command" and not stack:
+                words = text.split()
+                decls[words[1] if len(words) > 1 else "?"] += t
+            if cls == "Meta.synthInstance" and not any(s[1] == "Meta.synthInstance" for s in stack):
+                typeclass += t
+            stack.append([indent, cls, _tactic_name(text), t, 0.0])
+        while stack:
+            pop()
+    record = {
+        "decls": {k: round(v, 4) for k, v in decls.items()},
+        "tactics": {k: round(v, 4) for k, v in tactics.most_common()},
+        "typeclass": round(typeclass, 4),
+    }
+    return record
+
+def tactic_totals(input, rounds=None):
+    """Seconds per tactic summed over every verified round of a results file."""
+    totals = Counter()
+    for theorem in iter_theorems(input):
+        for profile in theorem.get("profile", [])[:rounds]:
+            totals.update(profile.get("tactics", {}))
+    return totals.most_common()
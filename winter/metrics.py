@@ -0,0 +1,103 @@
+from math import comb
+import numpy as np
+import os
+
+_BOOTSTRAP = 1000
+
+def verdict_matrix(theorems, field="verification", rounds=None):
+    """
+    (theorems x rounds) boolean matrix of "Pass" verdicts, plus how many rounds each theorem
+    actually has. Theorems that were never verified are left out. Short rows are padded with
+    their last verdict for `verification` (later rounds would have copied it) and with False
+    for independent samples.
+    """
+    # only the booleans are kept, so theorems can be streamed straight from the file
+    rows = [["Pass" in v for v in t[field]] for t in theorems if t.get(field)]
+    width = rounds or max((len(row) for row in rows), default=0)
+    matrix = np.zeros((len(rows), width), dtype=bool)
+    lengths = np.zeros(len(rows), dtype=int)
+    for i, row in enumerate(rows):
+        row = row[:width]
+        matrix[i, :len(row)] = row
+        if field == "verification":
+            matrix[i, len(row):] = row[-1]
+        lengths[i] = len(row)
+    return matrix, lengths
+
+def run_matrix(frame, column="passed"):
+    """verdict_matrix for one run's columnar table."""
+    frame = frame[frame[column].notna()] if column == "sample_passed" else frame[frame.verdict.notna()]
+    if len(frame) == 0:
+        return np.zeros((0, 0), dtype=bool), np.zeros(0, dtype=int)
+    table = frame.groupby(["theorem", "round"])[column].max().unstack()
+    lengths = table.notna().sum(axis=1).to_numpy()
+    if column == "passed":
+        table = table.ffill(axis=1)
+    return table.fillna(False).to_numpy(dtype=bool), lengths
+
+def pass_at_k(matrix, lengths, ks):
+    """
+    Per-theorem unbiased pass@k, 1 - C(n-c, k) / C(n, k), from n independent samples with c
+    passes. Theorems with fewer than k samples count as their empirical pass@n.
+    """
+    correct = matrix.sum(axis=1)
+    estimates = np.zeros((len(matrix), len(ks)))
+    for n in np.unique(lengths):
+        if n == 0:
+            continue
+        rows = lengths == n
+        for j, k in enumerate(ks):
+            k = min(k, n)
+            table = np.array([1 - comb(n - c, k) / comb(n, k) for c in range(n + 1)])
+            estimates[rows, j] = table[correct[rows]]
+    return estimates
+
+def refine_at_k(matrix, ks):
+    """Per-theorem refine@k (or pass@k with copied passes): solved in any of the first k rounds."""
+    solved = np.logical_or.accumulate(matrix, axis=1) if matrix.size else matrix
+    columns = [min(k, matrix.shape[1]) - 1 for k in ks]
+    return solved[:, columns].astype(float)
+
+def bootstrap(scores, samples=_BOOTSTRAP, confidence=95, seed=0):
+    """Mean and percentile confidence interval over theorems for each column of scores."""
+    n = len(scores)
+    if n == 0:
+        empty = np.full(scores.shape[1], np.nan)
+        return empty, empty, empty
+    rng = np.random.default_rng(seed)
+    # resampling theorems with replacement is a multinomial weighting of the rows
+    weights = rng.multinomial(n, np.full(n, 1 / n), size=samples)
+    means = weights @ scores / n
+    tail = (100 - confidence) / 2
+    return scores.mean(axis=0), np.percentile(means, tail, axis=0), np.percentile(means, 100 - tail, axis=0)
+
+def run_metrics(input, ks=None, models=(), samples=_BOOTSTRAP, confidence=95):
+    """
+    Accuracy curves of one results file with bootstrap CIs, as {metric: (k, mean, low, high)}.
+    refine@k is read off the recorded rounds. pass@k uses the unbiased estimator when the run
+    kept independent samples (sample_verification); without them it is the same curve.
+    """
+    # columnar needs pyarrow and pandas, which generation jobs that only print accuracy do not
+    from columnar import load_run
+    frame = load_run(input, models)
+    matrix, lengths = run_matrix(frame, "passed")
+    ks = np.array(ks or range(1, matrix.shape[1] + 1))
+    metrics = {"refine@k": refine_at_k(matrix, ks)}
+    if frame.sample_passed.notna().any():
+        metrics["pass@k"] = pass_at_k(*run_matrix(frame, "sample_passed"), ks)
+    else:
+        metrics["pass@k"] = metrics["refine@k"]
+    return {name: (ks, *(100 * v for v in bootstrap(scores, samples, confidence))) for name, scores in metrics.items()}
+
+def compare(dir, ks=None, models=(), samples=_BOOTSTRAP, confidence=95):
+    """run_metrics for every results file in dir."""
+    return {
+        name: run_metrics(os.path.join(dir, name), ks, models, samples, confidence)
+        for name in sorted(os.listdir(dir)) if name.endswith(".jsonl")
+    }
+
+if __name__ == "__main__":
+    for name, metrics in compare("../data/Final Tests").items():
+        for metric, (ks, mean, low, high) in metrics.items():
+            curve = ", ".join(f"{m:.1f} [{l:.1f}, {h:.1f}]" for m, l, h in zip(mean, low, high))
+            print(f"{name} {metric}: {curve}")
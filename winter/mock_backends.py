@@ -0,0 +1,115 @@
+import hashlib
+import random
+import time
+
+# stand-ins for a chat model and a Lean REPL, for benchmarking the orchestration offline
+
+class MockThrottle(Exception):
+    """Looks like a boto3 ThrottlingException to rate_limit.is_throttle."""
+
+    def __init__(self):
+        super().__init__("ThrottlingException: Rate exceeded")
+        self.response = {"Error": {"Code": "ThrottlingException"}}
+
+class MockMessage:
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class MockChatModel:
+    """
+    Answers every prompt with a unique, well-formed proof after `latency` seconds on average
+    (exponentially distributed). A `throttle_rate` fraction of calls raise a throttle instead.
+    """
+
+    def __init__(self, latency=0.05, output_tokens=800, throttle_rate=0.0, cache_rate=0.5, seed=None):
+        self.latency = latency
+        self.output_tokens = output_tokens
+        self.throttle_rate = throttle_rate
+        self.cache_rate = cache_rate
+        self.random = random.Random(seed)
+
+    def _respond(self, prompt):
+        if self.random.random() < self.throttle_rate:
+            time.sleep(self.latency / 10)
+            raise MockThrottle()
+        if self.latency:
+            time.sleep(self.random.expovariate(1 / self.latency))
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        input_tokens = len(text) // 4
+        nonce = self.random.getrandbits(64)
+        return MockMessage(
+            f"Here is the proof.\nFINAL```theorem bench_{nonce:x} : True := by\n  trivial```",
+            {
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": input_tokens + self.output_tokens,
+                "input_token_details": {"cache_read": int(input_tokens * self.cache_rate)},
+            },
+        )
+
+    def invoke(self, prompt, config=None, **kwargs):
+        return self._respond(prompt)
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        import asyncio
+        return await asyncio.to_thread(self._respond, prompt)
+
+    def batch(self, prompts, config=None, **kwargs):
+        return [self._respond(p) for p in prompts]
+
+class MockLeanMessage:
+    def __init__(self, severity, data):
+        self.severity = severity
+        self.data = data
+
+    def __str__(self):
+        return self.data
+
+class MockLeanResponse:
+    def __init__(self, valid, messages, env):
+        self.valid = valid
+        self.messages = messages
+        self.sorries = []
+        self.env = env
+
+    def lean_code_is_valid(self):
+        return self.valid
+
+    def get_errors(self):
+        return [m for m in self.messages if m.severity == "error"]
+
+class MockLeanServer:
+    """
+    Answers Commands like a REPL: headers elaborate once in `header_latency`, proofs take
+    `latency` seconds on average and pass, fail or time out with the given rates. Verdicts are
+    a deterministic function of the proof text, so a rerun sees the same outcome.
+    """
+
+    def __init__(self, pass_rate=0.4, timeout_rate=0.02, latency=0.01, header_latency=0.2):
+        self.pass_rate = pass_rate
+        self.timeout_rate = timeout_rate
+        self.latency = latency
+        self.header_latency = header_latency
+        self.envs = 0
+        self._proc = None
+
+    def run(self, command, timeout=None, add_to_session_cache=False, **kwargs):
+        if command.env is None and "theorem" not in command.cmd:
+            time.sleep(self.header_latency)
+            self.envs += 1
+            return MockLeanResponse(True, [], self.envs)
+        draw = int(hashlib.sha256(command.cmd.encode("utf-8")).hexdigest()[:8], 16) / 2**32
+        t = random.expovariate(1 / self.latency) if self.latency else 0
+        if draw < self.timeout_rate:
+            time.sleep(min(t, timeout or t))
+            raise TimeoutError("Lean command timed out")
+        time.sleep(t)
+        messages = [MockLeanMessage("info", f"[Elab.command] [{t:.6f}] theorem bench")]
+        valid = draw < self.timeout_rate + self.pass_rate
+        if not valid:
+            messages.append(MockLeanMessage("error", "unsolved goals"))
+        return MockLeanResponse(valid, messages, self.envs)
+
+    def kill(self):
+        pass
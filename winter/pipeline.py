@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from generate_concurrent import process_single_theorem, generation_started
+from init_model import provider_of
+from rate_limit import get_governor
+from verify import verify_theorem, carry_forward, LEAN_VERSION
+from verify_cache import VerifyCache
+from schedule import dataset_of, load_history
+from lean_pool import LeanPool
+from journal import Journal, load_journal
+from dotenv import load_dotenv
+from tqdm import tqdm
+from records import read_theorems
+
+def rounds_done(theorem):
+    return len(theorem.get("verification", []))
+
+def pad_passed(theorem, loops):
+    """Fill the remaining rounds of a passed theorem the same way generate_loop would."""
+    while rounds_done(theorem) < loops:
+        theorem["responses"].append(theorem["responses"][-1])
+        carry_forward(theorem)
+
+def generate_pipelined(input, output, model, temp, amend, workers=4, loops=1, pool=None, resume=False):
+    """
+    Run up to `loops` rounds per theorem with no barrier between generation and verification.
+    Every response goes straight to a Lean worker, and a failed theorem goes straight back to
+    the generation queue for its next round. Theorems already partly done in `input` resume
+    from their own round, so this also handles --repair. A warm `pool` is reused if given.
+    """
+    generation_started()
+    load_dotenv("../.env")
+    theorems = read_theorems(input)
+    if resume:
+        for i, theorem in load_journal(output).items():
+            if i < len(theorems) and rounds_done(theorem) > rounds_done(theorems[i]):
+                theorems[i] = theorem
+    journal = Journal(output, resume)
+
+    own_pool = pool is None
+    if own_pool:
+        try:
+            pool = LeanPool(LEAN_VERSION)
+        except Exception as e:
+            print(f"Exception: {e}")
+            return -1
+
+    cache = VerifyCache()
+    history = load_history(dataset_of(input), "verify_time")
+    governor = get_governor(provider_of(model), workers)
+    throttled = False
+    pending = {}
+    pbar = tqdm(total=len(theorems) * loops, desc="Pipelined Rounds")
+    pbar.update(sum(min(rounds_done(t), loops) for t in theorems))
+
+    with ThreadPoolExecutor(max_workers=workers) as gen_pool, ThreadPoolExecutor(max_workers=pool.workers) as ver_pool:
+        def submit_generation(i):
+            theorem = theorems[i]
+            # the first round is always a fresh proof, later rounds amend the previous one
+            fut = gen_pool.submit(process_single_theorem, theorem, model, temp, amend and len(theorem.get("responses", [])) > 0)
+            pending[fut] = ("generate", i)
+
+        def submit_verification(i):
+            fut = ver_pool.submit(verify_theorem, theorems[i], pool, cache, history)
+            pending[fut] = ("verify", i)
+
+        def advance(i):
+            theorem = theorems[i]
+            if rounds_done(theorem) >= loops:
+                return
+            if len(theorem.get("responses", [])) > rounds_done(theorem):
+                submit_verification(i)
+            elif rounds_done(theorem) > 0 and "Pass" in theorem["verification"][-1]:
+                before = rounds_done(theorem)
+                pad_passed(theorem, loops)
+                pbar.update(rounds_done(theorem) - before)
+            elif not throttled:
+                submit_generation(i)
+
+        for i in range(len(theorems)):
+            advance(i)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage, i = pending.pop(fut)
+                result = fut.result()
+                if stage == "generate":
+                    if result == -1:
+                        if not throttled:
+                            print("Generation is being throttled, finishing in-flight verification and saving progress.")
+                        throttled = True
+                        continue
+                    submit_verification(i)
+                else:
+                    pbar.update(1)
+                    journal.append(i, theorems[i])
+                    advance(i)
+
+    pbar.close()
+    if own_pool:
+        pool.close()
+    cache.report()
+    cache.close()
+    journal.compact(output, theorems)
+    print(governor)
+
+    if throttled:
+        print(f"Generation was throttled, please wait and try again soon.\n To continue run: python run.py --repair --pipeline {model} [amend] [dataset] [workers] [loops]")
+        return -1
+    return theorems
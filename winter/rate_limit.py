@@ -0,0 +1,136 @@
+from collections import deque
+import asyncio
+import threading
+import random
+import time
+import os
+
+# retries per theorem before a throttled request gives up and the round is abandoned
+MAX_RETRIES = 8
+_BASE_BACKOFF = 2
+_MAX_BACKOFF = 120
+_WINDOW = 60
+
+# optional hard quotas per provider as (requests/min, tokens/min); None only tracks the rate.
+# overridable with e.g. BEDROCK_CONVERSE_RPM / BEDROCK_CONVERSE_TPM in ../.env
+_PROVIDER_LIMITS = {
+    "bedrock_converse": (None, None),
+    "google_genai": (None, None),
+    "openai": (None, None),
+}
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+def is_throttle(e):
+    """True for the rate-limit errors of boto3, google-genai and openai."""
+    response = getattr(e, "response", None)
+    if isinstance(response, dict) and response.get("Error", {}).get("Code") in ("ThrottlingException", "TooManyRequestsException"):
+        return True
+    if getattr(e, "status_code", None) == 429 or getattr(e, "code", None) == 429:
+        return True
+    if type(e).__name__ in ("RateLimitError", "ResourceExhausted", "ThrottlingException"):
+        return True
+    # wrappers that drop the type keep the provider's error code in the message; a bare 429 in
+    # the text could just as well be a token count or an id
+    text = str(e)
+    return "RESOURCE_EXHAUSTED" in text or "ThrottlingException" in text
+
+def _limit(provider, kind, default):
+    value = os.getenv(f"{provider.upper()}_{kind}")
+    return int(value) if value else default
+
+class RateGovernor:
+    """
+    Shared by every request to one provider. Keeps requests/min and tokens/min over a sliding
+    window, and an AIMD concurrency limit: +1/limit per success, halved on every throttle.
+    """
+
+    def __init__(self, provider, max_concurrency):
+        rpm, tpm = _PROVIDER_LIMITS.get(provider, (None, None))
+        self.provider = provider
+        self.rpm = _limit(provider, "RPM", rpm)
+        self.tpm = _limit(provider, "TPM", tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.throttles = 0
+        self.requests = deque()
+        self.tokens = deque()
+        self.cond = threading.Condition()
+
+    def _expire(self, now):
+        while self.requests and now - self.requests[0] > _WINDOW:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] > _WINDOW:
+            self.tokens.popleft()
+
+    def _wait_time(self, now):
+        """Seconds until a new request fits every limit, 0 if it fits now."""
+        self._expire(now)
+        wait = 0
+        if self.rpm and len(self.requests) >= self.rpm:
+            wait = max(wait, _WINDOW - (now - self.requests[0]))
+        if self.tpm and self.tokens and sum(n for _, n in self.tokens) >= self.tpm:
+            wait = max(wait, _WINDOW - (now - self.tokens[0][0]))
+        if self.in_flight >= int(self.limit):
+            wait = max(wait, 1)
+        return wait
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                wait = self._wait_time(time.monotonic())
+                if wait == 0:
+                    break
+                self.cond.wait(timeout=wait)
+            self.in_flight += 1
+            self.requests.append(time.monotonic())
+
+    async def acquire_async(self):
+        """acquire() for the asyncio engine, waiting without blocking the event loop."""
+        while True:
+            with self.cond:
+                wait = self._wait_time(time.monotonic())
+                if wait == 0:
+                    self.in_flight += 1
+                    self.requests.append(time.monotonic())
+                    return
+            await asyncio.sleep(min(wait, 0.5))
+
+    def release(self, tokens=0, throttled=False):
+        with self.cond:
+            self.in_flight -= 1
+            if tokens:
+                self.tokens.append((time.monotonic(), tokens))
+            if throttled:
+                self.throttles += 1
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def backoff(self, attempt):
+        """Exponential backoff with jitter for the given retry attempt."""
+        return min(_MAX_BACKOFF, _BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def rates(self):
+        with self.cond:
+            self._expire(time.monotonic())
+            return len(self.requests), sum(n for _, n in self.tokens)
+
+    def __str__(self):
+        rpm, tpm = self.rates()
+        return f"{self.provider}: {rpm} req/min, {tpm} tok/min, concurrency {int(self.limit)}/{self.max_concurrency}, {self.throttles} throttles"
+
+def get_governor(provider, max_concurrency=None):
+    """The governor for a provider; max_concurrency (the worker count) resets its ceiling."""
+    with _governors_lock:
+        governor = _governors.get(provider)
+        if governor is None:
+            governor = _governors[provider] = RateGovernor(provider, max_concurrency or 4)
+        elif max_concurrency and max_concurrency != governor.max_concurrency:
+            with governor.cond:
+                governor.max_concurrency = max_concurrency
+                governor.limit = float(max_concurrency)
+        return governor
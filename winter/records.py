@@ -0,0 +1,127 @@
+from collections import deque
+import jsonlines as jsl
+import json
+import os
+
+def theorem_key(theorem):
+    """Stable identity of a theorem across runs, rounds and models."""
+    return theorem.get("name") or theorem.get("id") or theorem["formal_statement"]
+
+# what a round after the solved one holds in each per-round list: None repeats the solved round
+_REPEATED = {"responses": None, "verification": "Pass", "verify_time": None, "profile": {}}
+
+def solved_round(theorem):
+    for r, verdict in enumerate(theorem.get("verification", [])):
+        if "Pass" in verdict:
+            return r
+    return None
+
+def expand_theorem(theorem):
+    """Undo compact_theorem in place: re-append the rounds that only repeated the solved one."""
+    s = theorem.pop("solved_round", None)
+    rounds = theorem.pop("rounds", None)
+    if s is None or not rounds:
+        return theorem
+    for field, n in rounds.items():
+        values = theorem[field]
+        fill = _REPEATED[field]
+        while len(values) < n:
+            values.append(values[s] if fill is None else json.loads(json.dumps(fill)))
+    return theorem
+
+def compact_theorem(theorem):
+    """
+    On-disk form of a theorem: once it is solved, later rounds that just repeat the proof, its
+    "Pass" and its verify time are dropped, and solved_round / rounds record how to restore
+    them. Anything that would not expand back exactly is written as is.
+    """
+    s = solved_round(theorem)
+    if s is None:
+        return theorem
+    compact = dict(theorem)
+    rounds = {}
+    for field in _REPEATED:
+        values = theorem.get(field)
+        if values is not None and len(values) > s + 1:
+            compact[field] = values[:s + 1]
+            rounds[field] = len(values)
+    if not rounds:
+        return theorem
+    compact["solved_round"] = s
+    compact["rounds"] = rounds
+    if expand_theorem(json.loads(json.dumps(compact))) != theorem:
+        return theorem
+    return compact
+
+def iter_theorems(path, skip=0):
+    """Theorems of a JSONL file one at a time, after the first `skip`, expanded."""
+    with jsl.open(path) as reader:
+        for i, theorem in enumerate(reader):
+            if i >= skip:
+                yield expand_theorem(theorem)
+
+def read_theorems(path):
+    return list(iter_theorems(path))
+
+def write_theorems(path, theorems):
+    with jsl.open(path, mode="w") as writer:
+        for theorem in theorems:
+            writer.write(compact_theorem(theorem))
+
+def in_order(items, submit, window):
+    """
+    Call submit(item) for each item, keeping at most `window` futures outstanding, and yield
+    (item, future) in input order. Items are pulled lazily, so only the window is in memory;
+    finished futures behind a slow one wait in the deque, which is the reorder buffer.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, submit(item)))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+def _valid_prefix(path):
+    """Number of complete records in path, truncating a torn last line left by a crash."""
+    count = 0
+    offset = 0
+    with open(path, "rb+") as f:
+        for line in f:
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            count += 1
+            offset += len(line)
+        f.truncate(offset)
+    return count
+
+class StreamWriter:
+    """
+    Writes theorems in input order to output.<stage>.tmp and moves it over output on commit.
+    The partial file is its own checkpoint: with resume, the `done` theorems already in it are
+    kept and writing continues after them. Each stage has its own file, so what a crashed
+    verification leaves behind is never resumed as generated theorems.
+    """
+
+    def __init__(self, output, resume=False, stage="stream"):
+        self.output = output
+        self.tmp = f"{output}.{stage}.tmp"
+        self.done = _valid_prefix(self.tmp) if resume and os.path.exists(self.tmp) else 0
+        self.file = open(self.tmp, "a" if self.done else "w", encoding="utf-8")
+
+    def write(self, theorem):
+        self.file.write(json.dumps(compact_theorem(theorem), ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.done += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def commit(self):
+        self.close()
+        os.replace(self.tmp, self.output)
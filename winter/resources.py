@@ -0,0 +1,89 @@
+import psutil
+import os
+
+# what this job may actually use, which on SLURM is its cgroup, not the whole node
+
+_CGROUP_ROOT = "/sys/fs/cgroup"
+
+def _cgroup_dir(controller):
+    """This process's cgroup directory for a v1 controller, or its v2 unified directory."""
+    try:
+        with open("/proc/self/cgroup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    unified = None
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        if controllers == "":
+            unified = os.path.join(_CGROUP_ROOT, path.lstrip("/"))
+        elif controller in controllers.split(","):
+            return os.path.join(_CGROUP_ROOT, controllers, path.lstrip("/"))
+    return unified
+
+def _read_int(*paths):
+    for path in paths:
+        try:
+            with open(path) as f:
+                value = f.read().split()
+        except (OSError, TypeError):
+            continue
+        if value and value[0].isdigit():
+            return [int(v) if v.isdigit() else v for v in value]
+    return None
+
+def cpu_count():
+    """Cores this process may run on: its affinity mask, capped by a cgroup CPU quota."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    path = _cgroup_dir("cpu")
+    if path:
+        # v2 cpu.max is "<quota> <period>"; v1 splits them into two files
+        quota = _read_int(os.path.join(path, "cpu.max"))
+        if not quota:
+            quota = _read_int(os.path.join(path, "cpu.cfs_quota_us"))
+            period = _read_int(os.path.join(path, "cpu.cfs_period_us"))
+            quota = quota + period if quota and period else None
+        if quota and len(quota) == 2 and quota[1]:
+            cores = min(cores, max(1, quota[0] // quota[1]))
+    return cores
+
+def memory_limit_mb():
+    """Memory this job may use in MB: the cgroup limit (v2 memory.max or v1 limit_in_bytes) or RAM."""
+    total = psutil.virtual_memory().total
+    path = _cgroup_dir("memory")
+    if path:
+        limit = _read_int(os.path.join(path, "memory.max"), os.path.join(path, "memory.limit_in_bytes"))
+        if limit:
+            total = min(total, limit[0])
+    return total / 2**20
+
+def _memory_stat(path, *keys):
+    """The first of keys found in the cgroup's memory.stat, in bytes."""
+    try:
+        with open(os.path.join(path, "memory.stat")) as f:
+            stat = dict(line.split() for line in f if len(line.split()) == 2)
+    except OSError:
+        return 0
+    for key in keys:
+        if key in stat and stat[key].isdigit():
+            return int(stat[key])
+    return 0
+
+def memory_used_mb():
+    """
+    Memory this job is using in MB, counted like the OOM killer's working set: the cgroup usage
+    less its inactive file cache, which model weights and mmapped oleans fill and which the
+    kernel reclaims before it kills anything.
+    """
+    path = _cgroup_dir("memory")
+    if path:
+        used = _read_int(os.path.join(path, "memory.current"), os.path.join(path, "memory.usage_in_bytes"))
+        if used:
+            # v2 names it inactive_file; v1 counts the hierarchy in total_inactive_file
+            cache = _memory_stat(path, "inactive_file", "total_inactive_file")
+            return max(0, used[0] - cache) / 2**20
+    vm = psutil.virtual_memory()
+    return (vm.total - vm.available) / 2**20
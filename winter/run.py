@@ -1,47 +1,204 @@
 from dotenv import load_dotenv
 from generate_concurrent import generate_concurrent
+from generate_async import generate_async
+from generate_local import generate_batched, reset_telemetry
+from generate_samples import generate_samples
+from init_model import _LOCAL_MODELS, get_shared_model
 from verify import check_accuracy_all
 from verify import verify_parallel
+from verify import fold_samples
+from verify import LEAN_VERSION
+from lean_pool import LeanPool
+from pipeline import generate_pipelined
+from shard import parse_shard, env_shard, write_shard, merge_shards
 from sys import argv
 import jsonlines as jsl
+from functools import partial
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 import shutil
 import os
 
 load_dotenv("../.env")
 
 _TEMP = 0.05
+# requests in flight with --async when no worker count is given
+_ASYNC_CONCURRENCY = 256
 
-def generate_loop(data, model, amend, workers=4, loops=1, repair=False):
-    load_dotenv("../.env")
+def run_suffix(model, amend, loops):
+    """'_goedel_pass@4.jsonl': what generate_loop appends to the dataset name for its output."""
     at = f"pass@{loops}"
     if amend:
         at = f"amend@{loops}"
+    return f"_{model}_{at}.jsonl"
+
+def save_final(output):
+    if not os.path.exists(output):
+        # round 1 gave up before anything was written; its journal is picked up by --repair
+        print(f"No results in {output} yet")
+        return
+    if not output.split("/")[-1] in os.listdir("../data/Final Tests/"):
+        shutil.copy(output, "../data/Final Tests/")
+    else:
+        print(f"Test already exists. Please check {output} and maually back up.")
+
+def lean_pool(model):
+    """
+    The run's LeanPool, sized after a local model's engine is loaded, so the memory headroom it
+    measures already excludes the weights and KV cache in host memory.
+    """
+    if model in _LOCAL_MODELS:
+        get_shared_model(model, _TEMP)
+    return LeanPool(LEAN_VERSION)
+
+def serialized(fn, lock):
+    """fn, but holding lock for the whole call."""
+    def call(*args, **kwargs):
+        with lock:
+            return fn(*args, **kwargs)
+    return call
+
+def generate_loop(data, model, amend, workers=4, loops=1, repair=False, pipeline=False, use_async=False, samples=False, stream=False, pool=None, gpu_lock=None):
+    """
+    Run `loops` rounds of generation and verification. pool and gpu_lock are for run_matrix:
+    a shared warm LeanPool, and a lock that lets only one run at a time use the local model.
+    """
+    load_dotenv("../.env")
     sub = 0
-    output = data.split(".jsonl")[0] + f"_{model}_{at}.jsonl"
+    output = data.split(".jsonl")[0] + run_suffix(model, amend, loops)
     if not repair:
-        sub = 1
-        generate_concurrent(data, output, model, _TEMP, False, workers)
-        verify_parallel(output, output)
-        print(check_accuracy_all(output))
-    for i in range(loops - sub):
-        r = generate_concurrent(output, output, model, _TEMP, amend, workers)
-        if r == -1:
+        reset_telemetry(output)
+    # with --async, workers is the number of requests in flight rather than threads
+    generate = generate_async if use_async else generate_concurrent
+    if model in _LOCAL_MODELS:
+        # local models batch a whole round through one vLLM engine
+        generate = generate_batched
+        if pipeline:
+            # the pipeline generates per theorem on its own threads, each of which would load its own engine
+            print("--pipeline is not supported for local models, batching each round instead")
+            pipeline = False
+    verify = verify_parallel
+    if stream:
+        # bounded memory: theorems are streamed through both stages instead of loaded whole
+        if pipeline or samples:
+            print(f"--stream is not supported with {'--pipeline' if pipeline else '--samples'}, running in memory instead")
+        elif generate is generate_concurrent:
+            generate = partial(generate_concurrent, stream=True)
+        else:
+            print("--stream only streams verification for --async and local models, which generate each round in memory")
+        verify = partial(verify_parallel, stream=True)
+    sample = generate_samples
+    if gpu_lock is not None:
+        generate = serialized(generate, gpu_lock)
+        sample = serialized(generate_samples, gpu_lock)
+    # a repair before round 1 was ever written resumes that round from its journal, on the dataset
+    started = os.path.exists(output)
+    # one warm Lean pool for every round of this run
+    with (lean_pool(model) if pool is None else nullcontext(pool)) as pool:
+        if pipeline:
+            # rounds overlap per theorem; on repair each theorem resumes from its own round
+            generate_pipelined(output if repair and started else data, output, model, _TEMP, amend, workers, loops, pool, repair)
+            print(check_accuracy_all(output))
+            print(output)
             return output
-        verify_parallel(output, output)
-        print(check_accuracy_all(output))
+        if samples and not amend:
+            # pass@k as k samples from one request per theorem, verified together
+            # on repair, theorems that already have their k samples in the output are not sampled again
+            if sample(output if repair and started else data, output, model, _TEMP, loops, workers, repair) != -1:
+                verify_parallel(output, output, pool=pool)
+                fold_samples(output, output)
+                print(check_accuracy_all(output))
+            print(output)
+            return output
+        if not repair or not started:
+            sub = 1
+            if generate(data, output, model, _TEMP, False, workers, repair) == -1:
+                return output
+            verify(output, output, pool=pool)
+            print(check_accuracy_all(output))
+        for i in range(loops - sub):
+            r = generate(output, output, model, _TEMP, amend, workers, repair)
+            if r == -1:
+                return output
+            verify(output, output, pool=pool)
+            print(check_accuracy_all(output))
     print(output)
     return output
     
+def run_matrix(model, datasets, modes, workers=4, loops=4, shard=None, **flags):
+    """
+    Every (dataset, amend) combination against one model, in one process: the model is loaded
+    once and all runs share one warm LeanPool. The runs go side by side, so while one is
+    verifying in Lean another has the GPU; local generation is serialized by a lock since one
+    vLLM engine serves them all.
+    """
+    gpu_lock = threading.Lock() if model in _LOCAL_MODELS else None
+    runs = {}
+    with lean_pool(model) as pool:
+        with ThreadPoolExecutor(max_workers=len(datasets) * len(modes)) as executor:
+            for dataset in datasets:
+                data = f"../data/{dataset}.jsonl"
+                if shard:
+                    data = write_shard(data, *shard)
+                for amend in modes:
+                    future = executor.submit(generate_loop, data, model, amend, workers, loops,
+                                             pool=pool, gpu_lock=gpu_lock, **flags)
+                    runs[future] = (dataset, amend)
+            for future in as_completed(runs):
+                dataset, amend = runs[future]
+                try:
+                    output = future.result()
+                except Exception as e:
+                    print(f"{dataset} amend={amend} failed: {e}")
+                    continue
+                if not shard:
+                    save_final(output)
+    return runs
 
 if __name__ == "__main__":
     # parse args
+    pipeline = "--pipeline" in argv
+    if pipeline:
+        argv.remove("--pipeline")
+    use_async = "--async" in argv
+    if use_async:
+        argv.remove("--async")
+    default_workers = _ASYNC_CONCURRENCY if use_async else 4
+    samples = "--samples" in argv
+    if samples:
+        argv.remove("--samples")
+    stream = "--stream" in argv
+    if stream:
+        argv.remove("--stream")
+    # --matrix only: resume each run like --repair does
+    repair = "--resume" in argv
+    if repair:
+        argv.remove("--resume")
+    # --shard i/n, or the task of a SLURM job array: run only that deterministic slice of the dataset
+    shard = env_shard()
+    if "--shard" in argv:
+        at = argv.index("--shard")
+        shard = parse_shard(argv[at + 1])
+        del argv[at:at + 2]
+    if shard and "VERIFY_CACHE" not in os.environ:
+        # sqlite's WAL cannot be shared between nodes, so each shard keeps its own verdict cache
+        os.environ["VERIFY_CACHE"] = f"../data/shards/verify_cache_{shard[0]}of{shard[1]}.sqlite"
     argc = len(argv)
     # horrendous code reduncancy but whatever
     if argv[1] == "--help":
         print("Usage: python3 run.py <model: str> <amend: bool> [<workers: int> <loops: int>]")
+        print("       python3 run.py --final|--repair <model: str> <amend: bool> <F|C> [<workers: int> <loops: int>] [--pipeline] [--async] [--samples] [--stream] [--shard <i/n>]")
+        print("       python3 run.py --matrix <model: str> <amend: True,False> <datasets: F,C> [<workers: int> <loops: int>] [flags as for --final, and --resume]")
+        print("       python3 run.py --merge <model: str> <amend: bool> <F|C> <shards: int> [<loops: int>]")
+        print("  --pipeline: verify each response as soon as it is generated instead of once per round (API models only)")
+        print(f"  --async: generate with the models' async API; workers is then the number of requests in flight (default {_ASYNC_CONCURRENCY})")
+        print("  --samples: for pass@k, ask for all k samples per theorem at once (vLLM/OpenAI n, parallel elsewhere)")
+        print("  --stream: stream theorems through generation and verification in bounded memory, for very large datasets")
+        print("  --shard: run shard i of n (taken from SLURM_ARRAY_TASK_ID/COUNT in an array job); --merge joins the shards into Final Tests")
     elif argv[1] == "--gen":
         model = argv[2]
-        workers = 4
+        workers = default_workers
         if argc >= 4:
             workers = int(argv[3])
         
@@ -56,7 +213,7 @@ if __name__ == "__main__":
     elif argv[1] == "--final":
         model = argv[2]
         amend = argv[3] == "True"
-        workers = 4
+        workers = default_workers
         loops = 4
         if argv[4] == "C":
             dataset = "miniCTX"
@@ -66,15 +223,18 @@ if __name__ == "__main__":
             workers = int(argv[5])
         if argc >= 7:
             loops = int(argv[6])
-        output = generate_loop(f"../data/{dataset}.jsonl", model, amend, workers, loops, False)
-        if not output.split("/")[-1] in os.listdir("../data/Final Tests/"):
-            shutil.copy(output, "../data/Final Tests/")
+        data = f"../data/{dataset}.jsonl"
+        if shard:
+            # the shard's input is rewritten identically each time, so --repair picks up its output
+            output = generate_loop(write_shard(data, *shard), model, amend, workers, loops, False, pipeline, use_async, samples, stream)
+            print(f"Shard {shard[0]}/{shard[1]} done. Once every shard is, run: python run.py --merge {model} {amend} {argv[4]} {shard[1]} {loops}")
         else:
-            print(f"Test already exists. Please check {output} and maually back up.")
+            output = generate_loop(data, model, amend, workers, loops, False, pipeline, use_async, samples, stream)
+            save_final(output)
     elif argv[1] == "--repair":
         model = argv[2]
         amend = argv[3] == "True"
-        workers = 4
+        workers = default_workers
         loops = 4
         if argv[4] == "C": dataset = "miniCTX"
         else: dataset = "minif2f"
@@ -83,11 +243,39 @@ if __name__ == "__main__":
         if argc >= 7:
             loops = int(argv[6])
 
-        output = generate_loop(f"../data/{dataset}.jsonl", model, amend, workers, loops, True)
-        if not output.split("/")[-1] in os.listdir("../data/Final Tests/"):
-            shutil.copy(output, "../data/Final Tests/")
+        data = f"../data/{dataset}.jsonl"
+        if shard:
+            # the shard's input is rewritten identically each time, so --repair picks up its output
+            output = generate_loop(write_shard(data, *shard), model, amend, workers, loops, True, pipeline, use_async, samples, stream)
+            print(f"Shard {shard[0]}/{shard[1]} done. Once every shard is, run: python run.py --merge {model} {amend} {argv[4]} {shard[1]} {loops}")
         else:
-            print(f"Test already exists. Please check {output} and maually back up.")
+            output = generate_loop(data, model, amend, workers, loops, True, pipeline, use_async, samples, stream)
+            save_final(output)
+    elif argv[1] == "--matrix":
+        model = argv[2]
+        modes = [m == "True" for m in argv[3].split(",")]
+        datasets = ["miniCTX" if d == "C" else "minif2f" for d in argv[4].split(",")]
+        workers = default_workers
+        loops = 4
+        if argc >= 6:
+            workers = int(argv[5])
+        if argc >= 7:
+            loops = int(argv[6])
+        run_matrix(model, datasets, modes, workers, loops, shard,
+                   repair=repair, pipeline=pipeline, use_async=use_async, samples=samples, stream=stream)
+    elif argv[1] == "--merge":
+        model = argv[2]
+        amend = argv[3] == "True"
+        dataset = "miniCTX" if argv[4] == "C" else "minif2f"
+        shards = int(argv[5])
+        loops = 4
+        if argc >= 7:
+            loops = int(argv[6])
+        output, missing = merge_shards(f"../data/{dataset}.jsonl", shards, run_suffix(model, amend, loops), loops)
+        if missing:
+            print("Not copying to Final Tests until every theorem is covered; rerun the failed shards with --repair --shard i/n")
+            exit(1)
+        save_final(output)
     else:
         if argc < 3:
             print(f"Error: Expected at least 3 arguments, got {argc}")
@@ -96,7 +284,7 @@ if __name__ == "__main__":
 
         model = argv[1]
         amend = argv[2] == "True"
-        workers = 4
+        workers = default_workers
         loops = 1
         if argc >= 4:
             workers = int(argv[3])
@@ -104,4 +292,4 @@ if __name__ == "__main__":
             loops = int(argv[4])
 
 
-        generate_loop("../data/mini_minif2f.jsonl", model, amend, workers, loops)
+        generate_loop("../data/mini_minif2f.jsonl", model, amend, workers, loops, False, pipeline, use_async, samples, stream)
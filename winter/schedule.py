@@ -0,0 +1,57 @@
+from records import theorem_key, iter_theorems
+from functools import lru_cache
+import statistics
+import heapq
+import os
+
+_HISTORY_DIR = "../data/Final Tests"
+
+def dataset_of(path):
+    """'../data/minif2f_opus_amend@4.jsonl' -> 'minif2f'"""
+    return os.path.basename(path).split(".jsonl")[0].split("_")[0]
+
+def valid_times(times):
+    return [t for t in times if t is not None and t > 0]
+
+@lru_cache(maxsize=None)
+def load_history(dataset, field, model=None, dir=_HISTORY_DIR):
+    """Recorded `field` times per theorem from earlier runs on the same dataset, same model first."""
+    if not os.path.isdir(dir):
+        return {}
+    files = [f for f in os.listdir(dir) if f.startswith(dataset + "_") and f.endswith(".jsonl")]
+    same_model = [f for f in files if model and f"_{model}_" in f]
+    history = {}
+    for f in same_model or files:
+        for theorem in iter_theorems(os.path.join(dir, f)):
+            history.setdefault(theorem_key(theorem), []).extend(valid_times(theorem.get(field, [])))
+    return history
+
+def expected_times(theorems, field, history=None):
+    """
+    Expected seconds per theorem for `field` (model_time or verify_time): its own earlier rounds
+    if it has any, else earlier runs, else the median of everything known.
+    """
+    history = history or {}
+    estimates = []
+    for theorem in theorems:
+        times = valid_times(theorem.get(field, [])) or history.get(theorem_key(theorem), [])
+        estimates.append(statistics.mean(times) if times else None)
+    known = [e for e in estimates if e is not None]
+    default = statistics.median(known) if known else 1
+    return [default if e is None else e for e in estimates]
+
+def longest_first(indices, expected):
+    return sorted(indices, key=lambda i: expected[i], reverse=True)
+
+def makespan(durations, workers):
+    """Finish time of greedy list scheduling of durations, in order, onto `workers` slots."""
+    slots = [0.0] * max(1, workers)
+    for d in durations:
+        heapq.heappush(slots, heapq.heappop(slots) + d)
+    return max(slots)
+
+def report(expected, order, workers, label):
+    fifo = makespan([expected[i] for i in sorted(order)], workers)
+    lpt = makespan([expected[i] for i in order], workers)
+    if fifo > 0:
+        print(f"{label} schedule: expected makespan {lpt:.0f}s longest-first vs {fifo:.0f}s FIFO ({100 * (fifo - lpt) / fifo:.1f}% shorter)")
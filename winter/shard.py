@@ -0,0 +1,76 @@
+from records import theorem_key, iter_theorems, write_theorems
+import hashlib
+import os
+
+_SHARD_DIR = "../data/shards"
+
+def shard_of(theorem, count):
+    """Which of `count` shards a theorem belongs to; stable across runs, machines and orderings."""
+    digest = hashlib.sha256(theorem_key(theorem).encode("utf-8")).hexdigest()
+    return int(digest, 16) % count
+
+def parse_shard(text):
+    """'3/8' -> (3, 8)"""
+    index, count = (int(x) for x in text.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} is not in 0..{count - 1}")
+    return index, count
+
+def env_shard():
+    """(index, count) of this SLURM array task, or None outside an array job."""
+    index = os.getenv("SLURM_ARRAY_TASK_ID")
+    count = os.getenv("SLURM_ARRAY_TASK_COUNT")
+    if index is None or count is None:
+        return None
+    return int(index) - int(os.getenv("SLURM_ARRAY_TASK_MIN", 0)), int(count)
+
+def shard_path(data, index, count):
+    """'../data/minif2f.jsonl' -> '../data/shards/minif2f_shard3of8.jsonl'"""
+    name = os.path.basename(data).split(".jsonl")[0]
+    return os.path.join(_SHARD_DIR, f"{name}_shard{index}of{count}.jsonl")
+
+def write_shard(data, index, count):
+    """Write this shard's slice of the dataset and return its path, to run like any dataset."""
+    os.makedirs(_SHARD_DIR, exist_ok=True)
+    path = shard_path(data, index, count)
+    theorems = [t for t in iter_theorems(data) if shard_of(t, count) == index]
+    write_theorems(path, theorems)
+    print(f"Shard {index}/{count}: {len(theorems)} theorems in {path}")
+    return path
+
+def merge_shards(data, count, suffix, loops):
+    """
+    Stitch the `count` shard outputs of a run (shard path + suffix, e.g. '_goedel_pass@4.jsonl')
+    into one file in dataset order. Returns (output, missing): the theorems no shard has, or
+    that stopped short of `loops` rounds, are listed in missing by key.
+    """
+    found = {}
+    for index in range(count):
+        path = shard_path(data, index, count).split(".jsonl")[0] + suffix
+        if not os.path.exists(path):
+            print(f"Shard {index}/{count} has no output at {path}")
+            continue
+        for theorem in iter_theorems(path):
+            found[theorem_key(theorem)] = theorem
+
+    merged = []
+    missing = []
+    for theorem in iter_theorems(data):
+        key = theorem_key(theorem)
+        if key not in found:
+            missing.append(key)
+            continue
+        merged.append(found[key])
+        if len(found[key].get("verification", [])) < loops:
+            missing.append(key)
+
+    output = data.split(".jsonl")[0] + suffix
+    write_theorems(output, merged)
+    print(f"Merged {len(merged)} theorems from {count} shards into {output}")
+    if missing:
+        print(f"{len(missing)} theorems are missing or have fewer than {loops} verified rounds:")
+        for key in missing[:20]:
+            print(f"  {key}")
+        if len(missing) > 20:
+            print(f"  ... and {len(missing) - 20} more")
+    return output, missing
@@ -0,0 +1,73 @@
+from columnar import load_run, run_meta
+import json
+import os
+
+_INDEX = "summary_index.json"
+
+def summarize(input, models=()):
+    """Per-round aggregates of one results file: everything the plots need, none of the proofs."""
+    frame = load_run(input, models)
+    dataset, model, mode = run_meta(input, models)
+    rounds = int(frame["round"].max()) if len(frame) else 0
+    by_round = frame.groupby("round")
+
+    def sums(column):
+        totals = by_round[column].sum()
+        return [int(totals.get(r, 0)) for r in range(1, rounds + 1)]
+
+    def arrays(column):
+        return [frame[frame["round"] == r][column].dropna().tolist() for r in range(1, rounds + 1)]
+
+    # every request up to and including the one that passed, for the token scatter
+    solved = frame[frame.passed].groupby("theorem")["round"].min()
+    last = frame.theorem.map(solved).fillna(rounds)
+    calls = frame[(frame["round"] <= last) & frame.output_tokens.notna()]
+    return {
+        "dataset": dataset,
+        "model": model,
+        "mode": mode,
+        "theorems": int(frame.theorem.nunique()),
+        "rounds": rounds,
+        "passed": [int(frame[(frame["round"] == r) & frame.passed].shape[0]) for r in range(1, rounds + 1)],
+        "input_tokens": sums("input_tokens"),
+        "output_tokens": sums("output_tokens"),
+        "cached_tokens": sums("cached_tokens"),
+        "model_time": arrays("model_time"),
+        "verify_time": arrays("verify_time"),
+        "calls": [[int(i), int(o), bool(p)] for i, o, p in zip(calls.input_tokens.fillna(0), calls.output_tokens, calls.passed)],
+    }
+
+def load_index(dir, models=()):
+    """
+    Summary of every results file in dir, cached in dir/summary_index.json. Entries are keyed
+    on the file's mtime and size, so only new or changed files are summarized again.
+    """
+    path = os.path.join(dir, _INDEX)
+    index = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                index = json.load(f)
+        except ValueError:
+            index = {}
+
+    changed = False
+    current = {}
+    for name in sorted(os.listdir(dir)):
+        if not name.endswith(".jsonl"):
+            continue
+        stat = os.stat(os.path.join(dir, name))
+        entry = index.get(name)
+        if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            entry = summarize(os.path.join(dir, name), models)
+            entry["mtime"] = stat.st_mtime_ns
+            entry["size"] = stat.st_size
+            changed = True
+        current[name] = entry
+
+    if changed or current.keys() != index.keys():
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(current, f)
+        os.replace(tmp, path)
+    return current
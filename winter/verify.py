@@ -1,43 +1,164 @@
 from tqdm import tqdm
 from lean_interact import LeanREPLConfig, LeanServer, Command, AutoLeanServer
-from lean_interact.pool import LeanServerPool
 from lean_interact.project import TempRequireProject
-import jsonlines as jsl
 from lean_interact.interface import LeanError
+from verify_cache import VerifyCache
+from lean_pool import LeanPool
+from schedule import dataset_of, load_history, expected_times, longest_first, report, valid_times
+from records import theorem_key, iter_theorems, read_theorems, write_theorems, in_order, StreamWriter
+from lean_profile import parse_profile
+from metrics import verdict_matrix
 import matplotlib.pyplot as plt
 import re
 
-def verify_single_result(response, project):
+_PROFILER = "\n set_option trace.profiler true \n"
+LEAN_VERSION = "v4.16.0"
+
+# per-command Lean budgets: a multiple of the slowest recorded check of the theorem that passed
+# (or of any check in earlier runs) plus an allowance for the header, and one retry at
+# _RETRY_FACTOR times that, never under the old flat _DEFAULT_TIMEOUT, before calling it a timeout
+_DEFAULT_TIMEOUT = 60
+_MIN_TIMEOUT = 15
+_MAX_TIMEOUT = 180
+_TIMEOUT_FACTOR = 4
+_HEADER_SECONDS_PER_KB = 0.5
+_RETRY_FACTOR = 3
+_MAX_RETRY_TIMEOUT = 400
+
+def clean_response(response):
+    return response.replace("lean\n", "").strip()
+
+def passing_times(theorem):
+    """verify_time of the rounds that passed; a quick failure says nothing about a new proof."""
+    rounds = zip(theorem.get("verify_time", []), theorem.get("verification", []))
+    return valid_times([t for t, verdict in rounds if "Pass" in verdict])
+
+def timeout_for(theorem, history=None):
+    """(timeout, retry_timeout) in seconds for checking one response of theorem."""
+    times = passing_times(theorem) or (history or {}).get(theorem_key(theorem), [])
+    base = _TIMEOUT_FACTOR * max(times) if times else _DEFAULT_TIMEOUT
+    base += _HEADER_SECONDS_PER_KB * len(theorem["header"]) / 1024
+    timeout = min(_MAX_TIMEOUT, max(_MIN_TIMEOUT, base))
+    return timeout, min(_MAX_RETRY_TIMEOUT, max(_DEFAULT_TIMEOUT, timeout * _RETRY_FACTOR))
+
+def build_job(theorem, round=-1):
+    """(header, body) for one round; the pool elaborates the header once and runs the body against it."""
+    return theorem["header"], _PROFILER + clean_response(theorem["responses"][round])
+
+def cache_key(theorem, round=-1):
+    return VerifyCache.key(LEAN_VERSION, theorem["header"], clean_response(theorem["responses"][round]))
+
+def record_profile(theorem, profile):
+    """Append a round's profiler record, padding rounds verified before profiles were kept."""
+    profiles = theorem.setdefault("profile", [])
+    profiles.extend([{}] * (len(theorem["verification"]) - 1 - len(profiles)))
+    profiles.append(profile)
+
+def record_cached(theorem, cached):
+    verification, verify_time, profile = cached
+    theorem.setdefault("verification", []).append(verification)
+    theorem.setdefault("verify_time", []).append(verify_time)
+    record_profile(theorem, profile)
+
+def record_verification(theorem, eval):
+    """Append the verdict and Elab.command time of one REPL result (or exception) to theorem."""
+    theorem.setdefault("verification", [])
+    theorem.setdefault("verify_time", [])
+
+    if isinstance(eval, Exception):
+        # only a round that repeats an already passing proof may inherit its "Pass"; an
+        # independent sample that timed out is a timeout
+        if is_copied_forward(theorem, len(theorem["verification"])):
+            theorem["verification"].append("Pass")
+        else: 
+            theorem["verification"].append("Unknown Error: LEAN Verification timed out")
+        theorem["verify_time"].append(-1)
+        record_profile(theorem, {})
+        return
+
+    if not isinstance(eval, LeanError) and eval.lean_code_is_valid() and len(eval.sorries) == 0:
+        theorem["verification"].append("Pass")
+    else:
+        errors = ""
+        for error in eval.get_errors(): 
+            errors += str(error) + "; "
+        theorem["verification"].append("Fail: " + errors)
+    time = 0
+    for message in eval.messages:
+        if "[Elab.command]" in message.data and re.search(r"\[([0-9]+.[0-9]+)\]", message.data) != None:
+            time = float(re.findall(r"\[Elab\.command\] \[([0-9]+\.[0-9]+)\]", message.data)[0])
+    theorem["verify_time"].append(time)
+    record_profile(theorem, parse_profile(eval.messages))
+
+def carry_forward(theorem):
+    """Copy the last verdict and verify time into the next round without touching Lean."""
+    theorem["verification"].append(theorem["verification"][-1])
+    theorem["verify_time"].append(theorem["verify_time"][-1] if theorem.get("verify_time") else -1)
+    # nothing ran in Lean this round, so there is nothing to profile
+    record_profile(theorem, {})
+
+def is_copied_forward(theorem, round):
+    """True if `round` only repeats a response that already passed in the round before it."""
+    verification = theorem.get("verification", [])
+    return (0 < round == len(verification) and "Pass" in verification[round - 1]
+            and theorem["responses"][round] == theorem["responses"][round - 1])
+
+def verify_theorem(theorem, pool, cache=None, history=None):
+    """Verify the latest response of a single theorem on the shared pool."""
+    key = cache_key(theorem)
+    cached = cache.get(key) if cache else None
+    if cached:
+        record_cached(theorem, cached)
+        return theorem
+    try:
+        eval = pool.submit(*build_job(theorem), *timeout_for(theorem, history)).result()
+    except Exception as e:
+        eval = e
+    record_verification(theorem, eval)
+    # a verdict made up from an exception was never checked by Lean, so it is not cached
+    if cache and not isinstance(eval, Exception):
+        cache.put(key, theorem["verification"][-1], theorem["verify_time"][-1], theorem["profile"][-1])
+    return theorem
+
+def verify_single_result(response, project, cache=None):
+    if "ERROR: Generation failed" in response:
+        return "Generation failed, unable to verify"
+
+    key = VerifyCache.key(project.lean_version, "import Mathlib", response)
+    cached = cache.get(key) if cache else None
+    if cached:
+        return cached[0]
+
     server = None
     try:
         config = LeanREPLConfig(project=project)
         server = AutoLeanServer(config)
         
-        if "ERROR: Generation failed" in response:
-            return "Generation failed, unable to verify"
-        else:
-            try:
-                full_code = f"import Mathlib\n\n{response}"
-                command = Command(cmd=full_code)
-                eval = server.run(command, timeout = 20)
-                if not isinstance(eval, LeanError) and eval.lean_code_is_valid() and len(eval.sorries) == 0:
-                    return "Pass"
-                else:
-                    errors = ""
-                    for error in eval.get_errors(): 
-                        errors += str(error) + "; "
-                    return "Fail: " + errors
-            except TimeoutError: 
-                return "Unknown Error: LEAN Verification timed out"
-            except Exception as e:
-                return f"Verificiation Failed: {e}"
+        try:
+            full_code = f"import Mathlib\n\n{response}"
+            command = Command(cmd=full_code)
+            eval = server.run(command, timeout = 20)
+            if not isinstance(eval, LeanError) and eval.lean_code_is_valid() and len(eval.sorries) == 0:
+                verdict = "Pass"
+            else:
+                errors = ""
+                for error in eval.get_errors(): 
+                    errors += str(error) + "; "
+                verdict = "Fail: " + errors
+            if cache:
+                cache.put(key, verdict, -1)
+            return verdict
+        except TimeoutError: 
+            return "Unknown Error: LEAN Verification timed out"
+        except Exception as e:
+            return f"Verificiation Failed: {e}"
     finally:
         if server:
             server.kill()    
         
 def verify(input, output):
     project = None
-    theorems = list(jsl.open(input))
+    theorems = read_theorems(input)
     try:
         print("Setting Up Temp Project")
         project = TempRequireProject(lean_version="v4.7.0", require="mathlib")
@@ -45,6 +166,7 @@ def verify(input, output):
         print(f"Exception: {e}")
         return
 
+    cache = VerifyCache()
     count = 0
 
     for theorem in tqdm(theorems, desc="Verifying Results"):
@@ -56,93 +178,161 @@ def verify(input, output):
             continue
 
         try:
-            theorem['verification'].append(verify_single_result(theorem["responses"][-1], project))
+            theorem['verification'].append(verify_single_result(theorem["responses"][-1], project, cache))
         except Exception as e:
             theorem['verification'].append(f"Verification Failed: {e}")
         
         if count % 30 == 0:
-            with jsl.open(output, mode="w") as writer:
-                writer.write_all(theorems)
+            write_theorems(output, theorems)
 
-    with jsl.open(output, mode="w") as writer:
-        writer.write_all(theorems)
+    write_theorems(output, theorems)
+    cache.report()
+    cache.close()
     
     return theorems
 
 
-def verify_parallel(input, output):
-    project = None
-    theorems = list(jsl.open(input))
-    try:
-        print("Setting Up Temp Project")
-        project = TempRequireProject(lean_version="v4.16.0", require="mathlib")
-    except Exception as e:
-        print(f"Exception: {e}")
+def verify_streaming(input, output, cache, pool, window=None):
+    """
+    verify_parallel with bounded memory: theorems are read lazily, at most `window` of them have
+    jobs on the pool, and each is written out in input order once all its rounds are checked.
+    """
+    window = window or 8 * pool.workers
+    writer = StreamWriter(output, stage="verify")
+    checked = 0
+
+    def submit(theorem):
+        # one entry per round to verify: None to carry forward, a cached tuple, or (key, future)
+        jobs = []
+        for r in range(len(theorem.get("verification", [])), len(theorem["responses"])):
+            if is_copied_forward(theorem, r):
+                jobs.append(None)
+                continue
+            key = cache_key(theorem, r)
+            cached = cache.get(key)
+            # no cross-run history here, which grows with the dataset: budgets come from the theorem's own rounds
+            jobs.append(cached if cached else (key, pool.submit(*build_job(theorem, r), *timeout_for(theorem))))
+        return jobs
+
+    for theorem, jobs in tqdm(in_order(iter_theorems(input), submit, window), desc="Verifying Results"):
+        for job in jobs:
+            if job is None:
+                carry_forward(theorem)
+            elif len(job) == 3:
+                record_cached(theorem, job)
+            else:
+                key, future = job
+                eval = future.exception() or future.result()
+                record_verification(theorem, eval)
+                if not isinstance(eval, Exception):
+                    cache.put(key, theorem["verification"][-1], theorem["verify_time"][-1], theorem["profile"][-1])
+                checked += 1
+        writer.write(theorem)
+    writer.commit()
+    print(f"Verified {checked} responses")
+
+def verify_parallel(input, output, cache=None, pool=None, stream=False):
+    if stream:
+        own_cache, own_pool = cache is None, pool is None
+        cache = cache or VerifyCache()
+        pool = pool or LeanPool(LEAN_VERSION)
+        verify_streaming(input, output, cache, pool)
+        cache.report()
+        if own_pool:
+            pool.close()
+        if own_cache:
+            cache.close()
         return
+    theorems = read_theorems(input)
+    own_cache = cache is None
+    if own_cache:
+        cache = VerifyCache()
 
+    # one job per (theorem, round) that has a response but no verdict yet
+    jobs = []
     t_list = []
-    for theorem in theorems:
-        response = theorem["responses"][-1]
-        header = theorem["header"]
-        clean_response = response.replace("lean\n", "").strip()
-        full_code = header +"\n set_option trace.profiler true \n" + clean_response
-        options = [(["trace", "profiler"], True)]
-        command = Command(cmd=full_code)
-        t_list.append(command)
-    try:
-        config = LeanREPLConfig(project=project)    
-        pool = LeanServerPool(config)
-    except Exception as e:
-        print(e)
-    
-    try:
-        r_list = pool.run_batch(t_list, show_progress=True, timeout_per_cmd=60)
-        pool.close()
-    except Exception as e:
-        r_list =[]
-        print(e)
-    ct = 0
+    keys = []
+    owners = []
     for i, theorem in enumerate(theorems):
-        if not "verification" in theorem.keys():
-            theorem['verification'] = []
-
-        eval = r_list[i]
-
-        if isinstance(eval, Exception):
-            if len(theorem["verification"])>0 and theorem["verification"][-1] == "Pass":
-                theorem["verification"].append("Pass")
-            else: 
-                theorem["verification"].append("Unknown Error: LEAN Verification timed out")
-            if "verify_time" in theorem.keys(): 
-                theorem["verify_time"].append(-1)
+        for r in range(len(theorem.get("verification", [])), len(theorem["responses"])):
+            if is_copied_forward(theorem, r):
+                jobs.append((i, None))
+                continue
+            key = cache_key(theorem, r)
+            cached = cache.get(key)
+            if cached:
+                jobs.append((i, cached))
             else:
-                theorem["verify_time"] = [-1]
-            continue
+                jobs.append((i, len(t_list)))
+                t_list.append(build_job(theorem, r))
+                keys.append(key)
+                owners.append(theorem)
+    print(f"Verifying {len(t_list)} responses, reusing {len(jobs) - len(t_list)} verdicts")
+
+    r_list = []
+    own_pool = pool is None
+    if t_list:
+        if own_pool:
+            try:
+                pool = LeanPool(LEAN_VERSION)
+            except Exception as e:
+                print(f"Exception: {e}")
+                return
         
-        if not isinstance(eval, LeanError) and eval.lean_code_is_valid() and len(eval.sorries) == 0:
-            theorem["verification"].append("Pass")
-            ct+=1
-        else:
-            errors = ""
-            for error in eval.get_errors(): 
-                errors += str(error) + "; "
-            theorem["verification"].append("Fail: " + errors)
-        messages = eval.messages
-        time= 0
-        for message in messages:
-            if "[Elab.command]" in message.data and re.search(r"\[([0-9]+.[0-9]+)\]", message.data) != None:
-                time = float(re.findall(r"\[Elab\.command\] \[([0-9]+\.[0-9]+)\]", message.data)[0])
-                
-        if "verify_time" in theorem.keys():
-            theorem["verify_time"].append(time)
+        # longest expected proofs go to the workers first
+        history = load_history(dataset_of(input), "verify_time")
+        expected = expected_times(owners, "verify_time", history)
+        order = longest_first(range(len(t_list)), expected)
+        report(expected, order, pool.workers, "Verification")
+        budgets = [timeout_for(owners[j], history) for j in order]
+        try:
+            r_sorted = pool.run_batch([t_list[j] for j in order], show_progress=True,
+                                      timeouts=[b[0] for b in budgets], retry_timeouts=[b[1] for b in budgets])
+            r_list = [None] * len(t_list)
+            for pos, j in enumerate(order):
+                r_list[j] = r_sorted[pos]
+        except Exception as e:
+            r_list =[]
+            print(e)
+        if own_pool:
+            pool.close()
+
+    for i, k in jobs:
+        if k is None:
+            carry_forward(theorems[i])
+        elif isinstance(k, tuple):
+            record_cached(theorems[i], k)
         else:
-            theorem["verify_time"] = [time]
-    with jsl.open(output, mode="w") as writer:
-        writer.write_all(theorems)
+            record_verification(theorems[i], r_list[k])
+            if not isinstance(r_list[k], Exception):
+                cache.put(keys[k], theorems[i]["verification"][-1], theorems[i]["verify_time"][-1], theorems[i]["profile"][-1])
+    write_theorems(output, theorems)
+    cache.report()
+    if own_cache:
+        cache.close()
+
+
+def fold_samples(input, output):
+    """
+    Turn k independently verified samples into pass@k rounds: round r is "Pass" once any of the
+    first r samples passed, as in generate_loop's pass@k files. Each sample's own verdict is kept
+    in sample_verification, and responses keep every sample.
+    """
+    theorems = read_theorems(input)
+    for theorem in theorems:
+        if "sample_verification" in theorem or "verification" not in theorem:
+            continue
+        theorem["sample_verification"] = list(theorem["verification"])
+        passed = False
+        for r, verdict in enumerate(theorem["verification"]):
+            if passed:
+                theorem["verification"][r] = "Pass"
+            passed = passed or "Pass" in verdict
+    write_theorems(output, theorems)
 
 
 def check_accuracy(input):
-    theorems = list(jsl.open(input))
+    theorems = read_theorems(input)
     num = 0
     sum = len(theorems)
     for x in theorems:
@@ -153,21 +343,8 @@ def check_accuracy(input):
     return f"{num}/{sum} Passed"
 
 def check_accuracy_all(input):
-    theorems = list(jsl.open(input))
-    num = []
-    num1=[]
-    sum = len(theorems)
-    for x in theorems[-1]['verification']:
-        num.append(0)
-    for theorem in theorems:
-        if 'verification' not in theorem.keys():
-            sum-=1
-        else:
-            for i, x in enumerate(theorem['verification']):
-                if "Pass" in x: num[i] +=1
-    for x in num:
-        num1.append(x*100/sum)
-    return num1
+    matrix, lengths = verdict_matrix(iter_theorems(input))
+    return (matrix.mean(axis=0) * 100).tolist()
 
 def plot_time(input1, input2):
     gt = check_accuracy_all(input1)
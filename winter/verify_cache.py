@@ -0,0 +1,112 @@
+import sqlite3
+import json
+import hashlib
+import threading
+import os
+import socket
+import glob
+
+# sqlite's WAL needs shared memory, which GPFS does not give processes on different nodes, so
+# every host keeps its own cache file
+_CACHE_PATH = "../data/verify_cache_{host}.sqlite"
+
+class VerifyCache:
+    """
+    On-disk verdict cache written by every run on this host and read by runs on the others. Entries are keyed on a hash of the
+    Lean toolchain version, the header and the cleaned proof, so a proof is only ever checked
+    once per toolchain no matter which round, run or model produced it.
+    """
+
+    def __init__(self, path=None):
+        # VERIFY_CACHE points a process at its own cache, e.g. one per shard of an array job
+        path = path or os.getenv("VERIFY_CACHE") or _CACHE_PATH.format(host=socket.gethostname())
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts "
+                "(key TEXT PRIMARY KEY, verdict TEXT, errors TEXT, verify_time REAL)"
+            )
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(verdicts)")]
+            if "profile" not in columns:
+                self.conn.execute("ALTER TABLE verdicts ADD COLUMN profile TEXT")
+        # the caches of other hosts (or shards, or the old shared file) next to this one are only
+        # read, so a rerun SLURM puts on another node still finds the verdicts of the first run
+        self.others = []
+        for other in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(path)), "verify_cache*.sqlite"))):
+            if os.path.abspath(other) == os.path.abspath(path):
+                continue
+            try:
+                # immutable: no locks or -shm, which another node's WAL cannot share with us
+                self.others.append(sqlite3.connect(f"file:{other}?immutable=1", uri=True, check_same_thread=False))
+            except sqlite3.Error:
+                pass
+
+    @staticmethod
+    def key(lean_version, header, response):
+        h = hashlib.sha256()
+        for part in (lean_version, header, response):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _lookup_others(self, key):
+        for other in self.others:
+            try:
+                row = other.execute("SELECT verdict, errors, verify_time, profile FROM verdicts WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                # still being written by its own host, or from before profiles were kept
+                continue
+            if row is not None:
+                return row
+        return None
+
+    def get(self, key):
+        """Return (verification, verify_time, profile) for a cached proof, or None on a miss."""
+        with self.lock:
+            row = self.conn.execute("SELECT verdict, errors, verify_time, profile FROM verdicts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                row = self._lookup_others(key)
+                if row is not None:
+                    # copied into this host's own cache, so the next lookup is local
+                    with self.conn:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO verdicts (key, verdict, errors, verify_time, profile) VALUES (?, ?, ?, ?, ?)",
+                            (key, *row),
+                        )
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        verdict, errors, verify_time, profile = row
+        profile = json.loads(profile) if profile else {}
+        if verdict == "Pass":
+            return "Pass", verify_time, profile
+        return "Fail: " + errors, verify_time, profile
+
+    def put(self, key, verification, verify_time, profile=None):
+        # timeouts and crashes say nothing about the proof, so only real verdicts are kept
+        if verification == "Pass":
+            verdict, errors = "Pass", ""
+        elif verification.startswith("Fail: "):
+            verdict, errors = "Fail", verification[len("Fail: "):]
+        else:
+            return
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, errors, verify_time, profile) VALUES (?, ?, ?, ?, ?)",
+                (key, verdict, errors, verify_time, json.dumps(profile) if profile else None),
+            )
+
+    def report(self):
+        print(f"Verification cache: {self.hits} hits, {self.misses} misses")
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.conn.close()
+        for other in self.others:
+            other.close()